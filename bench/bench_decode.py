@@ -0,0 +1,228 @@
+"""Benchmark packet decoding in process_payload.
+
+Decrypts and decodes a corpus of ServiceEnvelope payloads with the
+current code and with the previous per-packet key/JSON round trip, and
+checks that both produce the same data.
+
+    python -m bench.bench_decode --corpus envelopes.txt
+
+The corpus holds one base64 encoded ServiceEnvelope per line. Without
+--corpus a synthetic one, encrypted with [mesh] channel_key, is used.
+The legacy path only knows that key.
+"""
+import argparse
+import base64
+import json
+import random
+import statistics
+import sys
+import time
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+from google.protobuf.json_format import MessageToJson
+from meshtastic import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+import meshinfo_channels
+import process_payload
+
+CHANNEL = meshinfo_channels.get_registry().default
+LEGACY_KEY = base64.b64encode(CHANNEL.key).decode()
+
+
+def legacy_decrypt_packet(mp):
+    key_bytes = base64.b64decode(LEGACY_KEY)
+    nonce = getattr(mp, "id").to_bytes(8, "little") + \
+        getattr(mp, "from").to_bytes(8, "little")
+    cipher = Cipher(
+        algorithms.AES(key_bytes),
+        modes.CTR(nonce),
+        backend=default_backend()
+    )
+    decryptor = cipher.decryptor()
+    decrypted_bytes = decryptor.update(
+        getattr(mp, "encrypted")
+    ) + decryptor.finalize()
+    data = mesh_pb2.Data()
+    data.ParseFromString(decrypted_bytes)
+    mp.decoded.CopyFrom(data)
+    return mp
+
+
+def legacy_to_json(msg):
+    return json.loads(
+        MessageToJson(
+            msg,
+            preserving_proto_field_name=True,
+            ensure_ascii=False,
+            indent=2,
+            sort_keys=True,
+            use_integers_for_enums=True
+        )
+    )
+
+
+def legacy_decode(payload):
+    se = mqtt_pb2.ServiceEnvelope()
+    se.ParseFromString(payload)
+    mp = se.packet
+    if mp.HasField("encrypted") and not mp.HasField("decoded"):
+        mp = legacy_decrypt_packet(mp)
+    j = legacy_to_json(mp)
+    if "decoded" not in j:
+        return None
+    payload_type = process_payload.PAYLOAD_TYPES.get(j["decoded"]["portnum"])
+    if payload_type:
+        j["type"], message_class = payload_type
+        if message_class is None:
+            j["decoded"]["json_payload"] = {"text": mp.decoded.payload}
+        else:
+            j["decoded"]["json_payload"] = legacy_to_json(
+                message_class.FromString(mp.decoded.payload)
+            )
+    return j
+
+
+def current_decode(payload):
+    mp = process_payload.get_packet(payload)
+    return process_payload.get_data(mp) if mp else None
+
+
+def synthetic_payload(rnd, node_ids):
+    node_id = rnd.choice(node_ids)
+    portnum = rnd.choice(list(process_payload.PAYLOAD_TYPES))
+    if portnum == portnums_pb2.NODEINFO_APP:
+        msg = mesh_pb2.User(
+            id=f"!{node_id:08x}",
+            long_name=f"Bench node {node_id % 1000}",
+            short_name=f"{node_id & 0xffff:04x}",
+            hw_model=rnd.randint(1, 60),
+            role=rnd.randint(0, 11)
+        )
+    elif portnum == portnums_pb2.MAP_REPORT_APP:
+        msg = mqtt_pb2.MapReport(
+            long_name=f"Bench node {node_id % 1000}",
+            short_name=f"{node_id & 0xffff:04x}",
+            firmware_version="2.5.0.abcdef",
+            region=3,
+            latitude_i=int(rnd.uniform(48.6, 51.0) * 10000000),
+            longitude_i=int(rnd.uniform(12.1, 18.8) * 10000000),
+            num_online_local_nodes=rnd.randint(1, 200)
+        )
+    elif portnum == portnums_pb2.TEXT_MESSAGE_APP:
+        msg = None
+        body = "Ahoj z benchmarku č. %d" % rnd.randint(0, 9999)
+    elif portnum == portnums_pb2.NEIGHBORINFO_APP:
+        msg = mesh_pb2.NeighborInfo(
+            node_id=node_id,
+            node_broadcast_interval_secs=900,
+            neighbors=[
+                mesh_pb2.Neighbor(
+                    node_id=rnd.choice(node_ids),
+                    snr=rnd.uniform(-20, 10)
+                )
+                for _ in range(rnd.randint(1, 8))
+            ]
+        )
+    elif portnum == portnums_pb2.ROUTING_APP:
+        msg = mesh_pb2.Routing(error_reason=rnd.randint(0, 8))
+    elif portnum == portnums_pb2.TRACEROUTE_APP:
+        msg = mesh_pb2.RouteDiscovery(
+            route=rnd.sample(node_ids, 3),
+            snr_towards=[rnd.randint(-80, 40) for _ in range(4)]
+        )
+    elif portnum == portnums_pb2.POSITION_APP:
+        msg = mesh_pb2.Position(
+            latitude_i=int(rnd.uniform(48.6, 51.0) * 10000000),
+            longitude_i=int(rnd.uniform(12.1, 18.8) * 10000000),
+            altitude=rnd.randint(150, 1500),
+            time=int(time.time()),
+            precision_bits=32
+        )
+    else:
+        msg = telemetry_pb2.Telemetry(
+            time=int(time.time()),
+            device_metrics=telemetry_pb2.DeviceMetrics(
+                battery_level=rnd.randint(0, 101),
+                voltage=rnd.uniform(3.3, 4.2),
+                channel_utilization=rnd.uniform(0, 40),
+                air_util_tx=rnd.uniform(0, 10),
+                uptime_seconds=rnd.randint(0, 10 ** 6)
+            )
+        )
+    data = mesh_pb2.Data(
+        portnum=portnum,
+        payload=body.encode() if msg is None else msg.SerializeToString()
+    )
+    packet_id = rnd.randint(1, 0xffffffff)
+    nonce = packet_id.to_bytes(8, "little") + node_id.to_bytes(8, "little")
+    encryptor = Cipher(
+        algorithms.AES(CHANNEL.key),
+        modes.CTR(nonce)
+    ).encryptor()
+    se = mqtt_pb2.ServiceEnvelope(
+        channel_id=CHANNEL.name,
+        gateway_id=f"!{rnd.choice(node_ids):08x}"
+    )
+    mp = se.packet
+    setattr(mp, "from", node_id)
+    mp.to = 0xffffffff
+    mp.id = packet_id
+    mp.channel = CHANNEL.hash
+    mp.hop_limit = 3
+    mp.hop_start = 3
+    mp.rx_time = int(time.time())
+    mp.rx_snr = rnd.uniform(-20, 10)
+    mp.encrypted = encryptor.update(data.SerializeToString()) + \
+        encryptor.finalize()
+    return se.SerializeToString()
+
+
+def load_corpus(path):
+    with open(path) as f:
+        return [base64.b64decode(line) for line in f if line.strip()]
+
+
+def measure(name, func, corpus, runs):
+    timings = []
+    results = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        results = [func(payload) for payload in corpus]
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(
+        f"{name:<8} median={statistics.median(timings) * 1000:8.1f} ms "
+        f"min={best * 1000:8.1f} ms "
+        f"({len(corpus) / best:,.0f} packets/s)"
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="file with base64 envelopes")
+    parser.add_argument("--packets", type=int, default=5000)
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        rnd = random.Random(args.seed)
+        node_ids = rnd.sample(range(1, 0xfffffffe), args.nodes)
+        corpus = [
+            synthetic_payload(rnd, node_ids) for _ in range(args.packets)
+        ]
+    print(f"Decoding {len(corpus)} envelopes")
+
+    legacy = measure("legacy", legacy_decode, corpus, args.runs)
+    current = measure("current", current_decode, corpus, args.runs)
+    if legacy != current:
+        print("Decoded data differs between legacy and current path")
+        sys.exit(1)
+    print("Results identical")
+
+
+if __name__ == "__main__":
+    main()
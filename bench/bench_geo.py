@@ -0,0 +1,98 @@
+"""Check accuracy and speed of meshinfo_geo against geopy.
+
+    python -m bench.bench_geo --pairs 20000
+
+Random pairs around central Europe are compared with geopy's geodesic;
+the run fails if the ellipsoidal distance is off by more than
+--tolerance meters. Timings cover one 150-point LOS profile.
+"""
+import argparse
+import statistics
+import sys
+import time
+import numpy as np
+from geopy.distance import geodesic
+import meshinfo_geo
+import utils
+
+
+def measure(name, func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{name:<18} median={statistics.median(timings) * 1000:9.3f} ms "
+        f"min={min(timings) * 1000:9.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pairs", type=int, default=20000)
+    parser.add_argument("--max-km", type=float, default=300)
+    parser.add_argument("--tolerance", type=float, default=1.0)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = np.random.default_rng(args.seed)
+    lat1 = rnd.uniform(35, 65, args.pairs)
+    lon1 = rnd.uniform(-10, 30, args.pairs)
+    # Second point within --max-km, in a random direction
+    spread = args.max_km / 111.0
+    lat2 = lat1 + rnd.uniform(-spread, spread, args.pairs)
+    lon2 = lon1 + rnd.uniform(-spread, spread, args.pairs) / \
+        np.cos(np.radians(lat1))
+
+    reference = np.array([
+        geodesic((a, b), (c, d)).meters
+        for a, b, c, d in zip(lat1, lon1, lat2, lon2)
+    ])
+    ellipsoid = meshinfo_geo.geodesic(lat1, lon1, lat2, lon2)
+    sphere = meshinfo_geo.haversine(lat1, lon1, lat2, lon2)
+    scalar = np.array([
+        utils.distance_between_two_points(a, b, c, d) * 1000
+        for a, b, c, d in zip(lat1, lon1, lat2, lon2)
+    ])
+
+    geodesic_error = np.abs(ellipsoid - reference)
+    haversine_error = np.abs(sphere - reference) / reference
+    print(
+        f"geodesic  max error {geodesic_error.max():.4f} m, "
+        f"mean {geodesic_error.mean():.4f} m"
+    )
+    print(
+        f"haversine max error {haversine_error.max() * 100:.3f} %, "
+        f"matches utils: {np.allclose(sphere, scalar)}"
+    )
+
+    lats = np.linspace(49.5, 49.9, 150)
+    lons = np.linspace(15.0, 15.6, 150)
+    measure(
+        "geopy profile",
+        lambda: [geodesic((lats[0], lons[0]), (a, b)).meters
+                 for a, b in zip(lats, lons)],
+        args.runs
+    )
+    measure(
+        "geodesic profile",
+        lambda: meshinfo_geo.geodesic(lats[0], lons[0], lats, lons),
+        args.runs
+    )
+    measure(
+        "haversine profile",
+        lambda: meshinfo_geo.haversine(lats[0], lons[0], lats, lons),
+        args.runs
+    )
+
+    if geodesic_error.max() > args.tolerance or \
+            not np.allclose(sphere, scalar):
+        print("Accuracy check failed")
+        sys.exit(1)
+    print("Accuracy check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Benchmark MeshData.get_nodes against a seeded, disposable database.
+
+Compares the old per-node neighbor/position lookups with the bulk
+queries and reports SQL statements and latency for each.
+
+    python -m bench.bench_get_nodes --database meshdata_bench --nodes 1500
+
+The given database is wiped and reseeded; it must not be the one
+configured in config.ini.
+"""
+import argparse
+import configparser
+import random
+import statistics
+import sys
+import time
+import meshinfo_dbpool
+import meshinfo_metrics
+import utils
+from meshdata import MeshData
+
+SEED_TABLES = ["neighborinfo", "position", "telemetry", "nodeinfo"]
+
+
+def seed(md, nodes, neighbors, rnd):
+    cur = md.db.cursor()
+    for table in SEED_TABLES:
+        cur.execute(f"DELETE FROM {table}")
+    ids = rnd.sample(range(1, 0xfffffffe), nodes)
+    cur.executemany(
+        """INSERT INTO nodeinfo (id, long_name, short_name, hw_model, role,
+ts_seen) VALUES (%s, %s, %s, %s, %s, NOW() - INTERVAL %s SECOND)""",
+        [
+            (
+                nid,
+                f"Bench node {i}",
+                f"B{i % 1000:03d}",
+                rnd.randint(0, 60),
+                rnd.randint(0, 11),
+                rnd.randint(0, 86400)
+            )
+            for i, nid in enumerate(ids)
+        ]
+    )
+    cur.executemany(
+        """INSERT INTO position (id, altitude, latitude_i, longitude_i,
+position_time) VALUES (%s, %s, %s, %s, NOW())""",
+        [
+            (
+                nid,
+                rnd.randint(150, 1500),
+                int(rnd.uniform(48.6, 51.0) * 10000000),
+                int(rnd.uniform(12.1, 18.8) * 10000000)
+            )
+            for nid in ids
+            if rnd.random() < 0.8
+        ]
+    )
+    neighbor_rows = set()
+    for nid in ids:
+        for other in rnd.sample(ids, neighbors):
+            if other != nid:
+                neighbor_rows.add((nid, other, rnd.randint(-80, 40)))
+    cur.executemany(
+        """INSERT INTO neighborinfo (id, neighbor_id, snr, ts_created)
+VALUES (%s, %s, %s, NOW())""",
+        list(neighbor_rows)
+    )
+    cur.executemany(
+        """INSERT INTO telemetry (id, battery_level, voltage, air_util_tx,
+channel_utilization, telemetry_time) VALUES (%s, %s, %s, %s, %s, NOW())""",
+        [
+            (
+                nid,
+                rnd.randint(0, 101),
+                rnd.uniform(3.3, 4.2),
+                rnd.uniform(0, 10),
+                rnd.uniform(0, 40)
+            )
+            for nid in ids
+        ]
+    )
+    cur.close()
+    md.db.commit()
+
+
+def legacy_get_nodes(md):
+    """get_nodes() as it was before the bulk queries: N+1 lookups."""
+    nodes = md.query_nodes(with_neighbors=False, with_position=False)
+    for node_id, node in nodes.items():
+        nid = utils.convert_node_id_from_hex_to_int(node_id)
+        node["neighbors"] = md.get_neighbors(nid)
+        pos = md.get_position(nid)
+        node["position"] = pos
+        if pos:
+            pos["latitude"] = pos["latitude_i"] / 10000000 \
+                if pos.get("latitude_i") else None
+            pos["longitude"] = pos["longitude_i"] / 10000000 \
+                if pos.get("longitude_i") else None
+    return nodes
+
+
+def measure(name, func, runs):
+    timings = []
+    statements = []
+    result = None
+    for _ in range(runs):
+        before = meshinfo_metrics.get_counter("db_statements")
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+        statements.append(
+            meshinfo_metrics.get_counter("db_statements") - before
+        )
+    print(
+        f"{name:<10} statements={statements[-1]:>6} "
+        f"median={statistics.median(timings) * 1000:9.1f} ms "
+        f"min={min(timings) * 1000:9.1f} ms"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--nodes", type=int, default=1500)
+    parser.add_argument("--neighbors", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    if args.database == config["database"]["database"]:
+        print("Refusing to wipe the configured database.")
+        sys.exit(2)
+
+    meshinfo_dbpool.init_pool(database=args.database)
+    md = MeshData()
+    md.setup_database()
+    seed(md, args.nodes, args.neighbors, random.Random(args.seed))
+    print(f"Seeded {args.nodes} nodes into '{args.database}'")
+
+    legacy = measure("legacy", lambda: legacy_get_nodes(md), args.runs)
+    bulk = measure("bulk", lambda: md.query_nodes(), args.runs)
+
+    for node_id in legacy:
+        for nodes in (legacy, bulk):
+            nodes[node_id].pop("last_seen", None)
+            nodes[node_id].pop("active", None)
+            nodes[node_id]["neighbors"].sort(key=lambda n: n["neighbor_id"])
+    if legacy != bulk:
+        print("Results differ between legacy and bulk get_nodes()")
+        sys.exit(1)
+    print("Results identical")
+
+
+if __name__ == "__main__":
+    main()
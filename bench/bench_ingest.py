@@ -0,0 +1,155 @@
+"""Benchmark ingest end to end with synthetic mesh traffic.
+
+Generates traffic of a synthetic mesh (see bench.synthetic_mesh),
+publishes it to a local stand-in for the MQTT client and lets
+meshinfo_mqtt's on_message handler take it from there, through
+IngestPipeline and process_payload into MeshData. Reports packets/sec,
+p50/p99 latency and SQL statements per packet.
+
+    python -m bench.bench_ingest --database meshdata_bench --nodes 300 \\
+        --packets 20000 --baseline bench/ingest_baseline.json
+
+The given MySQL database is wiped first; it must not be the one
+configured in config.ini. With --baseline the run fails (exit code 1)
+when throughput drops or statements per packet grow by more than
+--tolerance against the baseline; --write-baseline stores the result
+as the new baseline. --capture also writes the generated traffic as a
+capture file for bench.replay.
+"""
+import argparse
+import configparser
+import json
+import sys
+from paho.mqtt.client import MQTTMessage, topic_matches_sub
+import meshinfo_dbpool
+import meshinfo_ingest
+import meshinfo_mqtt
+from bench.replay import replay, report, wipe
+from bench.synthetic_mesh import SyntheticMesh
+from meshdata import MeshData
+from meshinfo_capture import CaptureWriter
+
+
+class LocalClient:
+    """Stands in for the paho client meshinfo_mqtt subscribes with."""
+
+    def __init__(self):
+        self.topics = []
+        self.on_message = None
+        self.unmatched = 0
+
+    def subscribe(self, topic):
+        self.topics.append(topic)
+
+    def publish(self, topic, payload):
+        if not any(topic_matches_sub(sub, topic) for sub in self.topics):
+            self.unmatched += 1
+            return
+        msg = MQTTMessage(topic=topic.encode("utf-8"))
+        msg.payload = payload
+        self.on_message(self, None, msg)
+
+
+def check(result, baseline, tolerance):
+    """Regressions of result against baseline, as messages."""
+    failures = []
+    if result["pps"] < baseline["pps"] * (1 - tolerance):
+        failures.append(
+            f"throughput {result['pps']:.1f} packets/s, "
+            f"baseline {baseline['pps']:.1f}"
+        )
+    if result["statements"] > baseline["statements"] * (1 + tolerance):
+        failures.append(
+            f"{result['statements']:.2f} SQL statements/packet, "
+            f"baseline {baseline['statements']:.2f}"
+        )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--gateways", type=int)
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--capture")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--write-baseline", action="store_true")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    if args.database == config["database"]["database"]:
+        print("Refusing to wipe the configured database.")
+        sys.exit(2)
+
+    meshinfo_dbpool.init_pool(database=args.database)
+    md = MeshData()
+    md.setup_database()
+    wipe(md)
+    md.close()
+
+    root = config["mqtt"]["topic"].split("#")[0].split("+")[0].rstrip("/")
+    mesh = SyntheticMesh(
+        nodes=args.nodes,
+        gateways=args.gateways,
+        seed=args.seed,
+        root=root or "msh"
+    )
+    records = mesh.records(args.packets)
+    print(
+        f"Synthetic mesh of {args.nodes} nodes, {len(mesh.gateways)} "
+        f"gateways: {len(records)} packets"
+    )
+    if args.capture:
+        writer = CaptureWriter(args.capture)
+        for ts, topic, payload in records:
+            writer.write(ts, topic, payload)
+        writer.close()
+
+    client = LocalClient()
+
+    def connect(pipeline):
+        # on_message submits to the shared pipeline, make it this one.
+        meshinfo_ingest._pipeline = pipeline
+        meshinfo_mqtt.subscribe(client)
+        return lambda payload, topic: client.publish(topic, payload)
+
+    result = replay(
+        records,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        connect=connect
+    )
+    report(result)
+    if client.unmatched:
+        print(f"{client.unmatched} packets outside {client.topics}")
+
+    if args.baseline and args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    key: result[key]
+                    for key in ("pps", "p50", "p99", "statements")
+                },
+                f,
+                indent=2
+            )
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = check(result, baseline, args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        if failures:
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Benchmark terrain loading and sampling for LOS profiles.
+
+Reports startup time and resident memory of the shared terrain store
+and the latency of elevation lookups for the memory-mapped and the
+tiled layer, compared with reading the whole band per call as
+LOSProfile used to.
+
+    python -m bench.bench_terrain --terrain srtm_data/terrain_data.tif
+
+Without --terrain a synthetic raster of --size x --size cells is written
+to a temporary directory and used instead.
+"""
+import argparse
+import os
+import resource
+import statistics
+import tempfile
+import time
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds, rowcol
+import meshinfo_terrain
+
+# Bounding box of the Czech Republic, roughly what srtm_data covers.
+BOUNDS = (12.0, 48.5, 19.0, 51.1)
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_synthetic(path, size):
+    rnd = np.random.default_rng(1)
+    data = rnd.integers(150, 1600, size=(size, size), dtype=np.int16)
+    with rasterio.open(
+        path, "w", driver="GTiff", height=size, width=size, count=1,
+        dtype="int16", crs="EPSG:4326",
+        transform=from_bounds(*BOUNDS, size, size)
+    ) as dataset:
+        dataset.write(data, 1)
+
+
+def legacy_sample(path, lats, lons):
+    """What every LOSProfile method did: open, decode band, index."""
+    with rasterio.open(path) as dataset:
+        rows, cols = rowcol(dataset.transform, lons, lats)
+        rows = np.clip(rows, 0, dataset.height - 1)
+        cols = np.clip(cols, 0, dataset.width - 1)
+        return dataset.read(1)[rows, cols]
+
+
+def measure(name, func, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{name:<16} median={statistics.median(timings) * 1000:9.2f} ms "
+        f"min={min(timings) * 1000:9.2f} ms"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terrain", help="GeoTIFF with elevations")
+    parser.add_argument("--size", type=int, default=8000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = None
+    path = args.terrain
+    if not path:
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, "terrain_data.tif")
+        write_synthetic(path, args.size)
+        print(f"Synthetic raster {args.size}x{args.size} in {path}")
+
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    layer = meshinfo_terrain.MappedRasterLayer(path)
+    print(
+        f"first open       {time.perf_counter() - start:9.2f} s "
+        f"rss +{rss_mb() - base_rss:.0f} MB (decodes the band)"
+    )
+    start = time.perf_counter()
+    layer = meshinfo_terrain.MappedRasterLayer(path)
+    print(
+        f"warm open        {time.perf_counter() - start:9.4f} s "
+        f"rss +{rss_mb() - base_rss:.0f} MB"
+    )
+
+    lats = np.linspace(49.1, 50.3, 150)
+    lons = np.linspace(14.2, 16.9, 150)
+    store = measure(
+        "store profile", lambda: layer.sample(lats, lons), args.runs
+    )
+    measure(
+        "store point", lambda: layer.value(49.7, 15.5), args.runs
+    )
+    print(f"rss after store  {rss_mb():9.0f} MB peak {peak_mb():.0f} MB")
+    tiled_layer = meshinfo_terrain.TiledRasterLayer(path)
+    tiled = measure(
+        "tiled profile", lambda: tiled_layer.sample(lats, lons), args.runs
+    )
+    measure(
+        "tiled cold point",
+        lambda: meshinfo_terrain.TiledRasterLayer(path).value(49.7, 15.5),
+        args.runs
+    )
+    measure(
+        "bilinear profile",
+        lambda: tiled_layer.sample(lats, lons, "bilinear"),
+        args.runs
+    )
+    print(
+        f"rss after tiled  {rss_mb():9.0f} MB peak {peak_mb():.0f} MB "
+        f"({len(tiled_layer.tiles)} tiles cached)"
+    )
+    legacy = measure(
+        "legacy profile", lambda: legacy_sample(path, lats, lons), args.runs
+    )
+    print(f"rss after legacy {rss_mb():9.0f} MB peak {peak_mb():.0f} MB")
+    if not np.array_equal(store, legacy) or not np.array_equal(tiled, legacy):
+        print("Sampled elevations differ")
+        raise SystemExit(1)
+    print("Results identical")
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
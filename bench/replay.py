@@ -0,0 +1,150 @@
+"""Replay an MQTT capture through the ingest pipeline.
+
+Feeds the messages of a capture written with [mqtt] capture_file into
+IngestPipeline without a broker and reports packets/sec, p50/p99
+latency from submit until the batch is committed, and SQL statements
+per packet.
+
+    python -m bench.replay capture.bin --database meshdata_bench --speed 0
+
+--speed 1 keeps the captured timing, N replays N times faster and 0 as
+fast as the pipeline accepts. The given database is wiped first; it
+must not be the one configured in config.ini.
+"""
+import argparse
+import configparser
+import sys
+import time
+import meshinfo_dbpool
+import meshinfo_metrics
+import meshinfo_nodeseen
+from meshdata import MeshData
+from meshinfo_capture import read_capture
+from meshinfo_ingest import IngestPipeline
+
+INGEST_TABLES = [
+    "meshlog", "text", "telemetry", "telemetry_rollup", "traceroute",
+    "neighborinfo", "position", "positionlog", "nodeinfo"
+]
+
+
+class ReplayPipeline(IngestPipeline):
+    """IngestPipeline that records when each packet was committed."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def write_batch(self, batch):
+        super().write_batch(batch)
+        done = time.monotonic()
+        self.latencies.extend(done - received for _, _, received in batch)
+
+
+def wipe(md):
+    cur = md.db.cursor()
+    for table in INGEST_TABLES:
+        cur.execute(f"DELETE FROM {table}")
+    cur.close()
+    md.commit()
+    meshinfo_nodeseen.get_tracker().reset()
+
+
+def replay(records, speed=0, workers=None, batch_size=None, connect=None):
+    """Feed (ts, topic, payload) records to a fresh pipeline.
+
+    connect(pipeline) may return the function records are submitted
+    with, by default pipeline.submit.
+    """
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    pipeline = ReplayPipeline.from_config(config)
+    if workers:
+        pipeline.workers = workers
+    if batch_size:
+        pipeline.batch_size = batch_size
+    pipeline.start()
+    submit = connect(pipeline) if connect else pipeline.submit
+
+    statements = meshinfo_metrics.get_counter("db_statements")
+    started = time.monotonic()
+    first_ts = None
+    packets = 0
+    for ts, topic, payload in records:
+        if speed:
+            if first_ts is None:
+                first_ts = ts
+            delay = (ts - first_ts) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        submit(payload, topic)
+        packets += 1
+    pipeline.join()
+    # ts_seen updates are written by the tracker, count them too.
+    md = MeshData()
+    meshinfo_nodeseen.get_tracker().flush(md)
+    md.close()
+    elapsed = time.monotonic() - started
+    latencies = sorted(pipeline.latencies)
+    return {
+        "packets": packets,
+        "dropped": pipeline.dropped,
+        "seconds": elapsed,
+        "pps": packets / elapsed if elapsed else 0,
+        "p50": latencies[len(latencies) // 2] if latencies else 0,
+        "p99": latencies[int(len(latencies) * 0.99)] if latencies else 0,
+        "statements": (
+            meshinfo_metrics.get_counter("db_statements") - statements
+        ) / max(packets, 1)
+    }
+
+
+def report(result):
+    print(
+        f"{result['packets']} packets in {result['seconds']:.2f}s: "
+        f"{result['pps']:.1f} packets/s, "
+        f"p50 {result['p50'] * 1000:.1f} ms, "
+        f"p99 {result['p99'] * 1000:.1f} ms, "
+        f"{result['statements']:.2f} SQL statements/packet, "
+        f"{result['dropped']} dropped"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture")
+    parser.add_argument("--database", required=True)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="1 = captured timing, N = N times faster, 0 = maximum"
+    )
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--batch-size", type=int)
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    if args.database == config["database"]["database"]:
+        print("Refusing to wipe the configured database.")
+        sys.exit(2)
+
+    meshinfo_dbpool.init_pool(database=args.database)
+    md = MeshData()
+    md.setup_database()
+    wipe(md)
+    md.close()
+
+    records = list(read_capture(args.capture))[:args.limit]
+    if not records:
+        print(f"No records in {args.capture}")
+        sys.exit(1)
+    span = records[-1][0] - records[0][0]
+    print(f"Replaying {len(records)} packets captured over {span:.0f}s")
+    report(replay(records, args.speed, args.workers, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
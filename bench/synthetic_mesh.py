@@ -0,0 +1,184 @@
+"""Synthetic mesh traffic for the ingest benchmarks.
+
+A fixed set of nodes with positions, neighbors and a few MQTT gateways
+emits packets in roughly the mix seen on a public MQTT feed. Packets are
+encrypted with the configured default channel and often heard by more
+than one gateway, so decryption and deduplication are exercised too.
+"""
+import random
+import time
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from meshtastic import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+import meshinfo_channels
+
+# portnum -> share of the packets
+PACKET_MIX = {
+    portnums_pb2.TELEMETRY_APP: 0.30,
+    portnums_pb2.POSITION_APP: 0.22,
+    portnums_pb2.NODEINFO_APP: 0.16,
+    portnums_pb2.ROUTING_APP: 0.09,
+    portnums_pb2.TEXT_MESSAGE_APP: 0.07,
+    portnums_pb2.NEIGHBORINFO_APP: 0.06,
+    portnums_pb2.MAP_REPORT_APP: 0.06,
+    portnums_pb2.TRACEROUTE_APP: 0.04,
+}
+# Chance that one more gateway reports the same packet
+DUPLICATE_RATE = 0.35
+
+
+class SyntheticMesh:
+    def __init__(self, nodes=300, gateways=None, seed=1, channel=None,
+                 root="msh/EU_868"):
+        self.rnd = random.Random(seed)
+        self.channel = channel or meshinfo_channels.get_registry().default
+        self.root = root
+        self.ids = self.rnd.sample(range(1, 0xfffffffe), nodes)
+        self.positions = {
+            node_id: (
+                self.rnd.uniform(48.6, 51.0),
+                self.rnd.uniform(12.1, 18.8),
+                self.rnd.randint(150, 1500)
+            )
+            for node_id in self.ids
+        }
+        self.sensors = set(self.rnd.sample(self.ids, nodes // 7))
+        self.gateways = self.rnd.sample(
+            self.ids, gateways or max(1, nodes // 10)
+        )
+        self.neighbors = {
+            node_id: self._nearest(node_id, 6) for node_id in self.ids
+        }
+        self.portnums = list(PACKET_MIX)
+        self.weights = list(PACKET_MIX.values())
+
+    def _nearest(self, node_id, count):
+        lat, lon, _ = self.positions[node_id]
+        return sorted(
+            (other for other in self.ids if other != node_id),
+            key=lambda other: (self.positions[other][0] - lat) ** 2
+            + (self.positions[other][1] - lon) ** 2
+        )[:count]
+
+    def _message(self, portnum, node_id):
+        rnd = self.rnd
+        lat, lon, alt = self.positions[node_id]
+        if portnum == portnums_pb2.NODEINFO_APP:
+            return mesh_pb2.User(
+                id=f"!{node_id:08x}",
+                long_name=f"Bench node {node_id % 1000}",
+                short_name=f"{node_id & 0xffff:04x}",
+                hw_model=node_id % 60 + 1,
+                role=node_id % 12
+            ).SerializeToString()
+        if portnum == portnums_pb2.POSITION_APP:
+            return mesh_pb2.Position(
+                latitude_i=int((lat + rnd.gauss(0, 0.0002)) * 10000000),
+                longitude_i=int((lon + rnd.gauss(0, 0.0002)) * 10000000),
+                altitude=alt,
+                time=int(time.time()),
+                precision_bits=32
+            ).SerializeToString()
+        if portnum == portnums_pb2.TELEMETRY_APP:
+            if node_id in self.sensors and rnd.random() < 0.5:
+                return telemetry_pb2.Telemetry(
+                    time=int(time.time()),
+                    environment_metrics=telemetry_pb2.EnvironmentMetrics(
+                        temperature=rnd.uniform(-10, 35),
+                        relative_humidity=rnd.uniform(20, 100),
+                        barometric_pressure=rnd.uniform(960, 1040)
+                    )
+                ).SerializeToString()
+            return telemetry_pb2.Telemetry(
+                time=int(time.time()),
+                device_metrics=telemetry_pb2.DeviceMetrics(
+                    battery_level=rnd.randint(0, 101),
+                    voltage=rnd.uniform(3.3, 4.2),
+                    channel_utilization=rnd.uniform(0, 40),
+                    air_util_tx=rnd.uniform(0, 10),
+                    uptime_seconds=rnd.randint(0, 10 ** 6)
+                )
+            ).SerializeToString()
+        if portnum == portnums_pb2.NEIGHBORINFO_APP:
+            return mesh_pb2.NeighborInfo(
+                node_id=node_id,
+                node_broadcast_interval_secs=900,
+                neighbors=[
+                    mesh_pb2.Neighbor(
+                        node_id=other, snr=rnd.uniform(-20, 10)
+                    )
+                    for other in self.neighbors[node_id]
+                ]
+            ).SerializeToString()
+        if portnum == portnums_pb2.TRACEROUTE_APP:
+            return mesh_pb2.RouteDiscovery(
+                route=self.neighbors[node_id][:3],
+                snr_towards=[rnd.randint(-80, 40) for _ in range(4)]
+            ).SerializeToString()
+        if portnum == portnums_pb2.MAP_REPORT_APP:
+            return mqtt_pb2.MapReport(
+                long_name=f"Bench node {node_id % 1000}",
+                short_name=f"{node_id & 0xffff:04x}",
+                firmware_version="2.5.0.abcdef",
+                region=3,
+                latitude_i=int(lat * 10000000),
+                longitude_i=int(lon * 10000000),
+                altitude=alt,
+                num_online_local_nodes=len(self.ids)
+            ).SerializeToString()
+        if portnum == portnums_pb2.TEXT_MESSAGE_APP:
+            return f"Ahoj z benchmarku č. {rnd.randint(0, 9999)}".encode()
+        return mesh_pb2.Routing(error_reason=0).SerializeToString()
+
+    def envelope(self, node_id, packet_id, portnum, payload, gateway, to):
+        nonce = packet_id.to_bytes(8, "little") + node_id.to_bytes(8, "little")
+        encryptor = Cipher(
+            algorithms.AES(self.channel.key),
+            modes.CTR(nonce)
+        ).encryptor()
+        data = mesh_pb2.Data(portnum=portnum, payload=payload)
+        se = mqtt_pb2.ServiceEnvelope(
+            channel_id=self.channel.name,
+            gateway_id=f"!{gateway:08x}"
+        )
+        mp = se.packet
+        setattr(mp, "from", node_id)
+        mp.to = to
+        mp.id = packet_id
+        mp.channel = self.channel.hash
+        mp.hop_limit = 3
+        mp.hop_start = 3
+        mp.rx_time = int(time.time())
+        mp.rx_snr = self.rnd.uniform(-20, 10)
+        mp.encrypted = encryptor.update(data.SerializeToString()) + \
+            encryptor.finalize()
+        return se.SerializeToString()
+
+    def records(self, count, rate=20, start=None):
+        """count (ts, topic, payload) records, rate packets per second."""
+        rnd = self.rnd
+        ts = start if start is not None else time.time()
+        records = []
+        while len(records) < count:
+            node_id = rnd.choice(self.ids)
+            portnum = rnd.choices(self.portnums, self.weights)[0]
+            to = 0xffffffff
+            if portnum == portnums_pb2.TRACEROUTE_APP:
+                to = rnd.choice(self.ids)
+            payload = self._message(portnum, node_id)
+            packet_id = rnd.randint(1, 0xffffffff)
+            gateways = [rnd.choice(self.gateways)]
+            while rnd.random() < DUPLICATE_RATE and \
+                    len(gateways) < len(self.gateways):
+                gateways.append(rnd.choice(self.gateways))
+            for gateway in gateways[:count - len(records)]:
+                ts += rnd.expovariate(rate)
+                topic = f"{self.root}/2/e/{self.channel.name}/" \
+                    f"!{gateway:08x}"
+                records.append((
+                    ts,
+                    topic,
+                    self.envelope(
+                        node_id, packet_id, portnum, payload, gateway, to
+                    )
+                ))
+        return records
@@ -1,10 +1,11 @@
+import argparse
 import os
 import logging
-import utils
 from meshdata import MeshData
-from meshinfo_los_profile import LOSProfile
+import meshinfo_los_batch
+import meshinfo_los_cache
 
-def run_cron_job():
+def run_cron_job(jobs=None):
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger("LOS")
 
@@ -22,19 +23,20 @@ def run_cron_job():
         return
 
     logger.info(f"Found {len(nodes)} nodes. Generating profiles...")
+    meshinfo_los_batch.generate_all(nodes, jobs=jobs)
 
-    for node_id in nodes.keys():
-        try:
-            logger.info(f"Processing node {node_id}...")
-            los_profile = LOSProfile(nodes, utils.convert_node_id_from_hex_to_int(node_id))
-            profiles = los_profile.get_profiles()
-
-            if profiles:
-                logger.info(f"Generated {len(profiles)} profiles for node {node_id}.")
-        except Exception as e:
-            logger.error(f"Error processing node {node_id}: {e}")
+    logger.info("Pruning LOS cache...")
+    meshinfo_los_cache.get_cache().prune()
 
     logger.info("Profile generation completed.")
 
 if __name__ == "__main__":
-    run_cron_job()
+    parser = argparse.ArgumentParser(description="Generate LOS profiles")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="rendering processes (default: number of CPUs)"
+    )
+    args = parser.parse_args()
+    run_cron_job(jobs=args.jobs)
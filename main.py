@@ -1,6 +1,9 @@
 import meshinfo_web
 import meshinfo_mqtt
 import meshinfo_api
+import meshinfo_retention
+import meshinfo_render
+import meshinfo_dbpool
 from meshdata import MeshData, create_database
 import threading
 import logging
@@ -109,14 +112,24 @@ if not db_connected:
     logger.error("Giving up. Bye.")
     sys.exit(1)
 
+# Fork the chart workers while this is still a single threaded process,
+# without open MySQL connections: workers must not share their sockets.
+# close() only hands the setup connection back to the pool.
+md.close()
+meshinfo_dbpool.get_pool().close_all()
+meshinfo_render.get_pool().start()
+
 thread_mqtt = threading.Thread(target=threadwrap(meshinfo_mqtt.run))
 thread_web = threading.Thread(target=threadwrap(meshinfo_web.run))
 thread_api = threading.Thread(target=threadwrap(meshinfo_api.run))
+thread_retention = threading.Thread(target=threadwrap(meshinfo_retention.run))
 
 thread_mqtt.start()
 thread_web.start()
 thread_api.start()
+thread_retention.start()
 
 thread_mqtt.join()
 thread_web.join()
-thread_api.join()
\ No newline at end of file
+thread_api.join()
+thread_retention.join()
\ No newline at end of file
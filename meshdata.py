@@ -1,12 +1,26 @@
 import configparser
 import mysql.connector
+import meshinfo_activity
+import meshinfo_dbpool
+import meshinfo_events
+import meshinfo_meshlog
+import meshinfo_migrations
+import meshinfo_nodecache
+import meshinfo_nodeseen
+import meshinfo_rollup
 import datetime
 import json
+import math
 import time
 import utils
 import logging
 import re
 import meshtastic_support
+from contextlib import contextmanager
+
+
+# Numeric telemetry columns that can be requested as series
+TELEMETRY_FIELDS = meshinfo_rollup.METRICS
 
 
 class CustomJSONEncoder(json.JSONEncoder):
@@ -29,11 +43,21 @@ class MeshData:
         config.read('config.ini')
         self.config = config
         self.db = None
+        self.in_transaction = False
+        self.changed_nodes = set()
+        self.moved_nodes = set()
+        self.events = []
+        self.deferred = []
+        self.savepoints = 0
         self.connect_db()
 
     def __del__(self):
+        self.close()
+
+    def close(self):
         if self.db:
             self.db.close()
+            self.db = None
 
     def int_id(self, id):
         try:
@@ -61,15 +85,94 @@ class MeshData:
         }
 
     def connect_db(self):
-        self.db = mysql.connector.connect(
-            host=self.config["database"]["host"],
-            user=self.config["database"]["username"],
-            password=self.config["database"]["password"],
-            database=self.config["database"]["database"],
-            charset="utf8mb4"
-        )
+        self.db = meshinfo_dbpool.get_connection()
+
+    def commit(self):
+        # Inside transaction() the commit is deferred to the end of the block.
+        if not self.in_transaction:
+            self.db.commit()
+            self.flush_invalidations()
+
+    @contextmanager
+    def transaction(self):
+        """Run several store calls as one database transaction."""
+        self.in_transaction = True
+        try:
+            yield self
+            self.in_transaction = False
+            self.db.commit()
+        except Exception:
+            self.in_transaction = False
+            self.db.rollback()
+            self.events = []
+            self.deferred = []
+            raise
+        finally:
+            self.flush_invalidations()
+
+    @contextmanager
+    def savepoint(self):
+        """Undo the statements and events of the block if it fails.
+
+        Errors after which MySQL rolled back the whole transaction are
+        re-raised as is, the caller has to retry the transaction.
+        """
+        self.savepoints += 1
+        name = f"sp{self.savepoints}"
+        events = len(self.events)
+        deferred = len(self.deferred)
         cur = self.db.cursor()
-        cur.execute("SET NAMES utf8mb4;")
+        cur.execute(f"SAVEPOINT {name}")
+        try:
+            yield self
+        except Exception as e:
+            if not meshinfo_dbpool.is_transaction_error(e):
+                cur.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                del self.events[events:]
+                del self.deferred[deferred:]
+            raise
+        else:
+            cur.execute(f"RELEASE SAVEPOINT {name}")
+        finally:
+            cur.close()
+
+    def invalidate_node(self, node_id, moved=False):
+        """Queue a node snapshot update, applied once the data is committed."""
+        if moved:
+            self.moved_nodes.add(node_id)
+        else:
+            self.changed_nodes.add(node_id)
+
+    def publish(self, event, data):
+        """Queue a live event, sent to clients once the data is committed."""
+        self.events.append((event, data))
+
+    def defer(self, func, *args):
+        """Call func(*args) once the data is committed."""
+        if self.in_transaction:
+            self.deferred.append((func, args))
+        else:
+            func(*args)
+
+    def flush_invalidations(self):
+        if self.deferred:
+            deferred = self.deferred
+            self.deferred = []
+            for func, args in deferred:
+                func(*args)
+        if self.events:
+            broker = meshinfo_events.get_broker()
+            for event, data in self.events:
+                broker.publish(event, data)
+            self.events = []
+        if not self.changed_nodes and not self.moved_nodes:
+            return
+        snapshot = meshinfo_nodecache.get_snapshot()
+        snapshot.invalidate(self.changed_nodes)
+        for node_id in self.moved_nodes:
+            snapshot.invalidate_position(node_id)
+        self.changed_nodes = set()
+        self.moved_nodes = set()
 
 
     def cleanup_nodes(self):
@@ -81,37 +184,17 @@ class MeshData:
             cur = self.db.cursor()
             cur.execute(sql)
             affected_rows = cur.rowcount
-            self.db.commit()
+            self.commit()
             cur.close()
+            meshinfo_nodecache.get_snapshot().invalidate()
+            meshinfo_nodeseen.get_tracker().reset()
             logging.info(f"Deleted {affected_rows} old nodes from nodeinfo.")
         except Exception as e:
             logging.error(f"Error cleaning up old nodes: {e}")
 
 
     def get_node_activity(self):
-        activity = {}
-        try:
-            sql = """SELECT 
-                        JSON_EXTRACT(message, '$.from') AS node_id,
-                        JSON_EXTRACT(message, '$.to') AS to_id,
-                        MAX(JSON_EXTRACT(message, '$.rx_time')) AS last_activity
-                     FROM meshlog
-                     WHERE ts_created >= NOW() - INTERVAL 15 SECOND
-                     GROUP BY node_id, to_id;"""
-            cur = self.db.cursor()
-            cur.execute(sql)
-            rows = cur.fetchall()
-            for row in rows:
-                node_id, to_id, last_activity = row
-                if node_id and last_activity:
-                    activity[utils.convert_node_id_from_int_to_hex(int(node_id))] = {
-                        "to": utils.convert_node_id_from_int_to_hex(int(to_id)) if to_id else None,
-                        "last_activity": int(last_activity)
-                    }
-            cur.close()
-        except Exception as e:
-            logging.error(f"Error fetching node activity from meshlog: {e}")
-        return activity
+        return meshinfo_activity.get_log().node_activity()
 
     def get_telemetry(self, id):
         telemetry = {}
@@ -196,6 +279,98 @@ ORDER BY ts_created"""
         cur.close()
         return telemetry
 
+    def get_telemetry_watermarks(self, node_id):
+        """Newest ts_created and row count behind each node chart.
+
+        Covers the same rows as get_node_telemetry() and
+        get_node_env_telemetry(); a chart only changes when these do.
+        """
+        sql = """SELECT
+MAX(CASE WHEN battery_level IS NOT NULL THEN ts_created END),
+SUM(battery_level IS NOT NULL),
+MAX(CASE WHEN temperature IS NOT NULL THEN ts_created END),
+SUM(temperature IS NOT NULL)
+FROM telemetry
+WHERE ts_created >= NOW() - INTERVAL 1 DAY
+AND id = %s"""
+        params = (node_id, )
+        cur = self.db.cursor()
+        cur.execute(sql, params)
+        row = cur.fetchone()
+        cur.close()
+
+        def watermark(ts, count):
+            return (ts.timestamp() if ts else None, int(count or 0))
+        return {
+            "telemetry": watermark(row[0], row[1]),
+            "env": watermark(row[2], row[3])
+        }
+
+    def get_telemetry_series(self, node_id, fields, since, buckets=None):
+        """Columnar telemetry of a node since a unix timestamp.
+
+        Only rows with at least one of the fields set are returned. With
+        buckets, the range up to now is split into that many equal
+        intervals and each field is reduced to min/avg/max per interval;
+        empty intervals are left out. Those are read from the rollups
+        when a resolution covers the range, else from the raw rows.
+        """
+        for field in fields:
+            if field not in TELEMETRY_FIELDS:
+                raise ValueError(f"Unknown telemetry field {field}")
+        cur = self.db.cursor()
+        rollup = meshinfo_rollup.get_rollup()
+        if buckets and rollup.enabled:
+            series = rollup.query(
+                cur, node_id, fields, since, time.time(), buckets
+            )
+            if series is not None:
+                cur.close()
+                return series
+        present = " OR ".join(f"{field} IS NOT NULL" for field in fields)
+        series = {"ts": [], "bucket": None}
+        if buckets:
+            width = max(1, math.ceil((time.time() - since) / buckets))
+            columns = ", ".join(
+                f"MIN({field}), AVG({field}), MAX({field})"
+                for field in fields
+            )
+            sql = f"""SELECT FLOOR(UNIX_TIMESTAMP(ts_created) / %s) AS bucket,
+{columns}
+FROM telemetry
+WHERE ts_created >= FROM_UNIXTIME(%s)
+AND id = %s AND ({present})
+GROUP BY bucket
+ORDER BY bucket"""
+            cur.execute(sql, (width, since, node_id))
+            series["bucket"] = width
+            for field in fields:
+                series[field] = {"min": [], "avg": [], "max": []}
+            for row in cur.fetchall():
+                series["ts"].append(int(row[0]) * width)
+                for i, field in enumerate(fields):
+                    for j, agg in enumerate(("min", "avg", "max")):
+                        series[field][agg].append(
+                            meshinfo_rollup.round_value(row[1 + i * 3 + j])
+                        )
+        else:
+            sql = f"""SELECT UNIX_TIMESTAMP(ts_created), {", ".join(fields)}
+FROM telemetry
+WHERE ts_created >= FROM_UNIXTIME(%s)
+AND id = %s AND ({present})
+ORDER BY ts_created"""
+            cur.execute(sql, (since, node_id))
+            for field in fields:
+                series[field] = []
+            for row in cur.fetchall():
+                series["ts"].append(int(row[0]))
+                for i, field in enumerate(fields):
+                    series[field].append(
+                        meshinfo_rollup.round_value(row[1 + i])
+                    )
+        cur.close()
+        return series
+
     def get_position(self, id):
         position = {}
         sql = "SELECT * FROM position WHERE id = %s"
@@ -213,9 +388,30 @@ ORDER BY ts_created"""
         cur.close()
         return position
 
-    def get_neighbors(self, id):
-        neighbors = []
-        sql = """SELECT
+    def get_positions(self, ids=None):
+        """Load all positions in one query, keyed by node id."""
+        positions = {}
+        sql = "SELECT * FROM position"
+        params = ()
+        if ids is not None:
+            sql += " WHERE id IN (" + ", ".join(["%s"] * len(ids)) + ")"
+            params = tuple(ids)
+        cur = self.db.cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        column_names = [desc[0] for desc in cur.description]
+        for row in rows:
+            position = {}
+            for i in range(1, len(row)):
+                if isinstance(row[i], datetime.datetime):
+                    position[column_names[i]] = row[i].timestamp()
+                else:
+                    position[column_names[i]] = row[i]
+            positions[row[0]] = position
+        cur.close()
+        return positions
+
+    NEIGHBORS_SQL = """SELECT
     a.id,
     a.neighbor_id,
     a.snr,
@@ -227,38 +423,63 @@ ORDER BY ts_created"""
 FROM neighborinfo a
 LEFT OUTER JOIN position p1 ON p1.id = a.id
 LEFT OUTER JOIN position p2 ON p2.id = a.neighbor_id
-WHERE a.id = %s
-AND a.ts_created > (NOW() - INTERVAL 3 DAY)
+WHERE a.ts_created > (NOW() - INTERVAL 3 DAY)
 """
+
+    def neighbor_record(self, row, column_names):
+        record = {}
+        for i in range(1, len(row)):
+            if isinstance(row[i], datetime.datetime):
+                record[column_names[i]] = row[i].timestamp()
+            else:
+                record[column_names[i]] = row[i]
+
+        if record["lat1_i"] and record["lon1_i"] and \
+                record["lat2_i"] and record["lon2_i"]:
+            distance = round(utils.distance_between_two_points(
+                record["lat1_i"] / 10000000,
+                record["lon1_i"] / 10000000,
+                record["lat2_i"] / 10000000,
+                record["lon2_i"] / 10000000
+            ), 2)
+        else:
+            distance = None
+        record["distance"] = distance
+        del record["lat1_i"]
+        del record["lon1_i"]
+        del record["lat2_i"]
+        del record["lon2_i"]
+        return record
+
+    def get_neighbors(self, id):
+        neighbors = []
+        sql = self.NEIGHBORS_SQL + "AND a.id = %s"
         params = (id, )
         cur = self.db.cursor()
         cur.execute(sql, params)
         rows = cur.fetchall()
         column_names = [desc[0] for desc in cur.description]
         for row in rows:
-            record = {}
-            for i in range(1, len(row)):
-                if isinstance(row[i], datetime.datetime):
-                    record[column_names[i]] = row[i].timestamp()
-                else:
-                    record[column_names[i]] = row[i]
+            neighbors.append(self.neighbor_record(row, column_names))
+        cur.close()
+        return neighbors
 
-            if record["lat1_i"] and record["lon1_i"] and \
-                    record["lat2_i"] and record["lon2_i"]:
-                distance = round(utils.distance_between_two_points(
-                    record["lat1_i"] / 10000000,
-                    record["lon1_i"] / 10000000,
-                    record["lat2_i"] / 10000000,
-                    record["lon2_i"] / 10000000
-                ), 2)
-            else:
-                distance = None
-            record["distance"] = distance
-            del record["lat1_i"]
-            del record["lon1_i"]
-            del record["lat2_i"]
-            del record["lon2_i"]
-            neighbors.append(record)
+    def get_all_neighbors(self, ids=None):
+        """Load the neighbors of every node in one query, keyed by node id."""
+        neighbors = {}
+        sql = self.NEIGHBORS_SQL
+        params = ()
+        if ids is not None:
+            sql += "AND a.id IN (" + ", ".join(["%s"] * len(ids)) + ")"
+            params = tuple(ids)
+        cur = self.db.cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        column_names = [desc[0] for desc in cur.description]
+        for row in rows:
+            neighbors.setdefault(row[0], []).append(
+                self.neighbor_record(row, column_names)
+            )
         cur.close()
         return neighbors
 
@@ -295,6 +516,22 @@ LIMIT 100"""
         return tracerouts
 
     def get_nodes(self, active=False, with_neighbors=True, with_position=True):
+        snapshot = meshinfo_nodecache.get_snapshot()
+        if snapshot.enabled:
+            return snapshot.get_nodes(
+                self,
+                active=active,
+                with_neighbors=with_neighbors,
+                with_position=with_position
+            )
+        return self.query_nodes(
+            active=active,
+            with_neighbors=with_neighbors,
+            with_position=with_position
+        )
+
+    def query_nodes(self, active=False, with_neighbors=True,
+                    with_position=True, ids=None):
         nodes = {}
         active_threshold = int(self.config["server"]["node_activity_prune_threshold"])
         base_sql = """
@@ -324,21 +561,26 @@ LEFT JOIN (
     JOIN (
         SELECT id, MAX(telemetry_time) AS max_time
         FROM telemetry
-        WHERE battery_level IS NOT NULL
+        WHERE battery_level IS NOT NULL {telemetry_filter}
         GROUP BY id
     ) t2 ON t1.id = t2.id AND t1.telemetry_time = t2.max_time
 ) t ON n.id = t.id
 WHERE n.id <> 4294967295
 """
+        params = ()
+        telemetry_filter = ""
+        if ids is not None:
+            placeholders = ", ".join(["%s"] * len(ids))
+            telemetry_filter = f"AND id IN ({placeholders})"
+            base_sql += f" AND n.id IN ({placeholders})"
+            params = tuple(ids) + tuple(ids)
+        base_sql = base_sql.replace("{telemetry_filter}", telemetry_filter)
         if active:
             base_sql += " AND n.ts_seen > FROM_UNIXTIME(%s)"
+            params += (time.time() - active_threshold, )
 
         cur = self.db.cursor()
-        if active:
-            timeout = time.time() - active_threshold
-            cur.execute(base_sql, (timeout,))
-        else:
-            cur.execute(base_sql)
+        cur.execute(base_sql, params)
 
         rows = cur.fetchall()
         column_names = [desc[0] for desc in cur.description]
@@ -360,15 +602,15 @@ WHERE n.id <> 4294967295
             node_ids.append(row[0])
         cur.close()
 
-        # Hromadné načtení neighbors a position
+        # Hromadné načtení neighbors a position (jeden dotaz pro všechny uzly)
         if with_neighbors:
-            neighbors_map = {nid: self.get_neighbors(nid) for nid in node_ids}
-            for idx, nid in enumerate(node_ids):
-                nodes[utils.convert_node_id_from_int_to_hex(nid)]["neighbors"] = neighbors_map[nid]
+            neighbors_map = self.get_all_neighbors(ids)
+            for nid in node_ids:
+                nodes[utils.convert_node_id_from_int_to_hex(nid)]["neighbors"] = neighbors_map.get(nid, [])
         if with_position:
-            positions_map = {nid: self.get_position(nid) for nid in node_ids}
-            for idx, nid in enumerate(node_ids):
-                pos = positions_map[nid]
+            positions_map = self.get_positions(ids)
+            for nid in node_ids:
+                pos = positions_map.get(nid, {})
                 node = nodes[utils.convert_node_id_from_int_to_hex(nid)]
                 node["position"] = pos
                 if pos:
@@ -418,22 +660,32 @@ ORDER BY ts_created DESC"""
         cur.close()
         return list(reversed(coords))
 
-    def get_logs(self):
+    def get_logs(self, node_id=None):
         logs = []
-        sql = "SELECT * FROM meshlog ORDER BY ts_created DESC limit 100"
+        sql = """SELECT topic, message, encoding, payload, ts_created
+FROM meshlog"""
+        params = ()
+        if node_id is not None:
+            sql += " WHERE from_id = %s"
+            params = (node_id, )
+        sql += " ORDER BY ts_created DESC LIMIT 100"
         cur = self.db.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-        column_names = [desc[0] for desc in cur.description]
-        for row in rows:
-            record = {}
-            for i in range(len(row)):
-                col = column_names[i]
-                if isinstance(row[i], datetime.datetime):
-                    record[col] = row[i].timestamp()
-                else:
-                    record[col] = row[i]
-            logs.append(record)
+        cur.execute(sql, params)
+        for topic, message, encoding, payload, ts_created in cur.fetchall():
+            if encoding:
+                # Compact rows are decoded on read, shown like legacy rows.
+                try:
+                    data = meshinfo_meshlog.unpack(encoding, payload)
+                except Exception as e:
+                    logging.error(f"Cannot decode meshlog row: {e}")
+                    data = {"error": str(e)}
+                message = json.dumps(data, indent=4, cls=CustomJSONEncoder)
+            logs.append({
+                "topic": topic,
+                "message": message,
+                "ts_created": ts_created.timestamp() if ts_created else None
+            })
+        cur.close()
         return logs
 
     def get_latest_node(self):
@@ -483,37 +735,34 @@ id=%s AND (geocoded IS NULL OR (latitude_i <> %s OR longitude_i <> %s))"""
         cur = self.db.cursor()
         cur.execute(sql, params)
         update = True if cur.fetchone() else False
-        geo = None
         cur.close()
         if not update:
             return
+        # The geocoder is slow, ask it once the position is committed.
+        self.defer(self.store_geocode, id, lat, lon)
 
-        latitude = lat / 10000000
-        longitude = lon / 10000000
+    def store_geocode(self, id, lat, lon):
         geocoded = utils.geocode_position(
             self.config['geocoding']['apikey'],
-            latitude,
-            longitude
+            lat / 10000000,
+            lon / 10000000
         )
+        geo = None
         if geocoded and "display_name" in geocoded:
             geo = geocoded["display_name"]
-
-        sql = """UPDATE position SET
+        try:
+            sql = """UPDATE position SET
 latitude_i = %s,
 longitude_i = %s,
 geocoded = %s
 WHERE id = %s
 """
-        params = (
-            lat,
-            lon,
-            geo,
-            id
-        )
-        cur = self.db.cursor()
-        cur.execute(sql, params)
-        cur.close()
-        self.db.commit()
+            cur = self.db.cursor()
+            cur.execute(sql, (lat, lon, geo, id))
+            cur.close()
+            self.commit()
+        except Exception as e:
+            logging.error(f"Failed to store geocoded position of {id}: {e}")
 
     def graph_nodes(self):
         graph_data = {
@@ -631,7 +880,8 @@ ts_updated = VALUES(ts_updated)"""
         )
         cur = self.db.cursor()
         cur.execute(sql, values)
-        self.db.commit()
+        self.invalidate_node(data["from"])
+        self.commit()
 
     def store_position(self, data, source="position"):
         payload = dict(data["decoded"]["json_payload"])
@@ -693,13 +943,14 @@ ts_updated = VALUES(ts_updated)"""
         )
         cur = self.db.cursor()
         cur.execute(sql, values)
+        self.invalidate_node(data["from"], moved=True)
         self.log_position(
             data["from"],
             payload["latitude_i"],
             payload["longitude_i"],
             source
         )
-        self.db.commit()
+        self.commit()
 
         # --- Zápis hop_start do nodeinfo, pokud je v datech ---
         if "hop_start" in data:
@@ -726,7 +977,8 @@ ts_updated = VALUES(ts_updated)"""
                 neighbor["snr"] if "snr" in neighbor else None
             )
             self.db.cursor().execute(sql, params)
-        self.db.commit()
+        self.invalidate_node(node_id)
+        self.commit()
 
     def store_traceroute(self, data):
         from_id = self.verify_node(data["from"])
@@ -748,7 +1000,7 @@ ts_updated = VALUES(ts_updated)"""
             snr
         )
         self.db.cursor().execute(sql, params)
-        self.db.commit()
+        self.commit()
 
     def update_hop_start(self, node_id, hop_start):
         """Aktualizuje hodnotu hop_start v tabulce nodeinfo pro daný node_id."""
@@ -757,18 +1009,10 @@ ts_updated = VALUES(ts_updated)"""
         cur = self.db.cursor()
         cur.execute(sql, params)
         cur.close()
-        self.db.commit()
+        self.invalidate_node(node_id)
+        self.commit()
 
     def store_telemetry(self, data):
-        cur = self.db.cursor()
-        cur.execute(f"SELECT COUNT(*) FROM telemetry")
-        count = cur.fetchone()[0]
-        if count >= 20000:
-            cur.execute(f"""DELETE FROM telemetry
-ORDER BY ts_created ASC LIMIT 1""")
-        cur.close()
-        self.db.commit()
-
         node_id = self.verify_node(data["from"])
         payload = dict(data["decoded"]["json_payload"])
 
@@ -816,8 +1060,14 @@ VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, FROM_UNIXTIME(%s))
             data_metrics["current"],
             payload["time"]
         )
-        self.db.cursor().execute(sql, params)
-        self.db.commit()
+        cur = self.db.cursor()
+        cur.execute(sql, params)
+        meshinfo_rollup.get_rollup().store(
+            cur, node_id, time.time(), data_metrics
+        )
+        cur.close()
+        self.invalidate_node(node_id)
+        self.commit()
 
         # --- Zápis hop_start do nodeinfo, pokud je v datech ---
         if "hop_start" in data:
@@ -837,7 +1087,22 @@ VALUES (%s, %s, %s, %s, NOW())"""
             data["channel"] if "channel" in data else 0
         )
         self.db.cursor().execute(sql, params)
-        self.db.commit()
+        if to_id == 4294967295:
+            node = meshinfo_nodecache.get_snapshot().node(from_id)
+            if node is None:
+                # Cache disabled or cold, the sender's row is enough.
+                node = self.query_nodes(
+                    ids=[from_id], with_neighbors=False, with_position=False
+                ).get(self.hex_id(from_id))
+            self.publish("chat", utils.chat_entry(
+                {
+                    "ts_created": time.time(),
+                    "from": self.hex_id(from_id),
+                    "text": payload["text"].decode()
+                },
+                {self.hex_id(from_id): node} if node else {}
+            ))
+        self.commit()
         match = re.search(
             r"meshinfo (\d{4})",
             payload["text"].decode(),
@@ -876,46 +1141,61 @@ SET owner = %s WHERE id = %s"""
         cur = self.db.cursor()
         cur.execute(sql, params)
         cur.close()
-        self.db.commit()
+        self.invalidate_node(node)
+        self.commit()
 
     def verify_node(self, id, via=None, noupdate=False):
-        query = "SELECT 1 FROM nodeinfo where id = %s"
-        param = (id, )
-        cur = self.db.cursor()
-        cur.execute(query, param)
-        found = True if cur.fetchone() else False
-        cur.close()
-        if not found:
-            self.store_node(self.unknown(id))
-        else:
-            if noupdate:
-                return id
-            if via:
-                sql = """UPDATE nodeinfo SET
-ts_seen = NOW(), updated_via = %s WHERE id = %s"""
-                param = (via, id)
-            else:
-                sql = "UPDATE nodeinfo SET ts_seen = NOW() WHERE id = %s"
-                param = (id, )
+        tracker = meshinfo_nodeseen.get_tracker()
+        if not tracker.is_known(self, id):
+            query = "SELECT 1 FROM nodeinfo where id = %s"
+            param = (id, )
             cur = self.db.cursor()
-            cur.execute(sql, param)
+            cur.execute(query, param)
+            found = True if cur.fetchone() else False
             cur.close()
+            if not found:
+                self.store_node(self.unknown(id))
+            self.defer(tracker.add, id)
+        if noupdate:
+            return id
+        # ts_seen/updated_via are written in batches by the tracker.
+        tracker.seen(id, via)
+        meshinfo_nodecache.get_snapshot().touch(id, via)
         return id
 
-    def log_data(self, topic, data):
-        cur = self.db.cursor()
-        cur.execute(f"SELECT COUNT(*) FROM meshlog")
-        count = cur.fetchone()[0]
-        if count >= 2000:
-            cur.execute(f"DELETE FROM meshlog ORDER BY ts_created ASC LIMIT 1")
-        self.db.commit()
-
-        sql = "INSERT INTO meshlog (topic, message) VALUES (%s, %s)"
-        params = (topic, json.dumps(data, indent=4, cls=CustomJSONEncoder))
+    def log_data(self, topic, data, raw=None):
+        codec = meshinfo_meshlog.get_codec()
+        encoding = None
+        payload = None
+        if codec.format == "json":
+            message = json.dumps(data, indent=4, cls=CustomJSONEncoder)
+        else:
+            message = json.dumps(
+                data, separators=(",", ":"), cls=CustomJSONEncoder
+            )
+            encoding, payload = codec.pack(message, raw)
+        sql = """INSERT INTO meshlog
+(topic, message, encoding, payload, from_id, to_id, portnum, gateway)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+        params = (
+            topic,
+            None if encoding else message,
+            encoding,
+            payload,
+            data.get("from"),
+            data.get("to"),
+            data.get("decoded", {}).get("portnum"),
+            self.int_id(topic.split("/")[-1])
+        )
         cur = self.db.cursor()
         cur.execute(sql, params)
         cur.close()
-        self.db.commit()
+        self.publish("log", {
+            "ts_created": time.time(),
+            "topic": topic,
+            "message": message
+        })
+        self.commit()
         logging.debug(json.dumps(data, indent=4, cls=CustomJSONEncoder))
 
     def log_position(self, id, lat, lon, source):
@@ -928,7 +1208,7 @@ AND id = %s"""
         cur = self.db.cursor()
         cur.execute(sql, params)
         cur.close()
-        self.db.commit()
+        self.commit()
         moved = True
         sql = """SELECT latitude_i, longitude_i FROM positionlog
 WHERE id = %s ORDER BY ts_created DESC LIMIT 1"""
@@ -947,17 +1227,30 @@ WHERE id = %s ORDER BY ts_created DESC LIMIT 1"""
         cur = self.db.cursor()
         cur.execute(sql, params)
         cur.close()
-        self.db.commit()
+        self.commit()
         logging.info(f"Position updated for {id}")
 
-    def store(self, data, topic):
+    def store(self, data, topic, raw=None):
         if not data:
             return
-        self.log_data(topic, data)
+        self.log_data(topic, data, raw)
         if "from" in data:
             frm = data["from"]
             via = self.int_id(topic.split("/")[-1])
             self.verify_node(frm, via)
+            to = data.get("to")
+            rx_time = int(data.get("rx_time") or time.time())
+            # Like the events, only once the packet is committed.
+            self.defer(
+                meshinfo_activity.get_log().record,
+                frm, to, rx_time, data.get("decoded", {}).get("portnum"), via
+            )
+            self.publish("activity", {
+                self.hex_id(frm): {
+                    "to": self.hex_id(to) if to else None,
+                    "last_activity": rx_time
+                }
+            })
         tp = data["type"]
         if tp == "nodeinfo":
             self.store_node(data)
@@ -1072,7 +1365,8 @@ WHERE id = %s ORDER BY ts_created DESC LIMIT 1"""
         for create in creates:
             cur.execute(create)
         cur.close()
-        self.db.commit()
+        self.commit()
+        meshinfo_migrations.migrate(self)
 
     def import_nodes(self, filename):
         fh = open(filename, "r")
@@ -1123,7 +1417,7 @@ ts_updated = VALUES(ts_updated)"""
             )
             cur = self.db.cursor()
             cur.execute(sql, values)
-        self.db.commit()
+        self.commit()
 
     def import_chat(self, filename):
         fh = open(filename, "r")
@@ -1165,7 +1459,7 @@ VALUES (%s, %s, %s, %s, FROM_UNIXTIME(%s))
                 cur.close()
             except Exception as e:
                 print(f"failed to write record.")
-        self.db.commit()
+        self.commit()
 
     def get_data_for_qr(self, node_id):
         sql = "SELECT long_name, short_name, macaddr, public_key, hw_model, role FROM nodeinfo WHERE id = %s"
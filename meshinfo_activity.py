@@ -0,0 +1,70 @@
+import configparser
+import threading
+import time
+from collections import deque
+import utils
+
+
+class ActivityLog:
+    """Ring buffer of recently received packets for the live map.
+
+    Ingest records (from, to, rx_time, portnum, gateway) of every packet,
+    so /api/node_activity no longer scans and parses meshlog rows.
+    """
+
+    def __init__(self, window=15, size=10000):
+        self.window = window
+        self.entries = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            window=config.getfloat("activity", "window", fallback=15),
+            size=config.getint("activity", "size", fallback=10000)
+        )
+
+    def record(self, from_id, to_id, rx_time=None, portnum=None,
+               gateway=None):
+        now = time.time()
+        with self.lock:
+            self.entries.append(
+                (now, from_id, to_id, rx_time or int(now), portnum, gateway)
+            )
+
+    def recent(self, window=None):
+        """Packets received in the last window seconds, oldest first."""
+        since = time.time() - (window or self.window)
+        with self.lock:
+            entries = list(self.entries)
+        # Entries are appended in receive order.
+        start = len(entries)
+        while start > 0 and entries[start - 1][0] >= since:
+            start -= 1
+        return entries[start:]
+
+    def node_activity(self, window=None):
+        """Latest packet per sending node, as served by /api/node_activity."""
+        activity = {}
+        for _, from_id, to_id, rx_time, _, _ in self.recent(window):
+            activity[utils.convert_node_id_from_int_to_hex(from_id)] = {
+                "to": utils.convert_node_id_from_int_to_hex(to_id)
+                if to_id else None,
+                "last_activity": int(rx_time)
+            }
+        return activity
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _log = ActivityLog.from_config(config)
+    return _log
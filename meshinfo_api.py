@@ -1,13 +1,17 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import configparser
 import logging
 import utils
-from meshdata import MeshData
+import meshinfo_activity
+import meshinfo_events
+import meshinfo_metrics
+from meshdata import MeshData, TELEMETRY_FIELDS
 from meshinfo_los_profile import LOSProfile
 from paste.translogger import TransLogger
 from waitress import serve
 import json
 import io
+import time
 import base64
 import qrcode
 from flask import send_file
@@ -28,11 +32,15 @@ app = Flask(__name__)
 config = configparser.ConfigParser()
 config.read("config.ini")
 
+# Longest history and finest downsampling /api/node/<id>/telemetry serves
+TELEMETRY_MAX_DAYS = config.getint("api", "telemetry_max_days", fallback=730)
+TELEMETRY_MAX_BUCKETS = 1000
+TELEMETRY_DEFAULT_FIELDS = "air_util_tx,battery_level,channel_utilization"
+
 
 @app.route('/api/node_activity', methods=['GET'])
 def node_activity():
-    md = MeshData()
-    activity = md.get_node_activity()
+    activity = meshinfo_activity.get_log().node_activity()
     return jsonify(activity)
 
 
@@ -42,18 +50,7 @@ def api_chat():
         md = MeshData()
         nodes = md.get_nodes(with_neighbors=False, with_position=False)
         chat = md.get_chat()
-        chat_data = []
-        for message in chat:
-            chat_entry = {
-                "ts_created": message["ts_created"],
-                "from": message["from"],
-                "text": message["text"]
-            }
-            if message["from"] in nodes:
-                chat_entry["short_name"] = nodes[message["from"]]["short_name"]
-                chat_entry["from_name"] = nodes[message["from"]]["long_name"] + " (" + nodes[message["from"]]["short_name"] + ")"
-                chat_entry["from_link"] = f"node_{message['from']}.html"
-            chat_data.append(chat_entry)
+        chat_data = [utils.chat_entry(message, nodes) for message in chat]
         return jsonify(chat_data)
     except Exception as e:
         app.logger.error(f"Chyba v /api/chat: {e}")
@@ -121,15 +118,95 @@ def api_elevation():
 
 @app.route('/api/logs', methods=['GET'])
 def api_logs():
+    node = request.args.get('node')
+    node_id = None
+    if node:
+        try:
+            node_id = utils.convert_node_id_from_hex_to_int(node)
+        except ValueError:
+            return jsonify({'error': 'Neplatné ID uzlu'}), 400
     try:
         md = MeshData()
-        logs = md.get_logs()
+        logs = md.get_logs(node_id)
         return jsonify(logs)
     except Exception as e:
         app.logger.error(f"Chyba v /api/logs: {e}")
         return jsonify({'error': 'Interní chyba serveru'}), 500
 
 
+@app.route('/api/node/<node>/telemetry', methods=['GET'])
+def api_node_telemetry(node):
+    """Columnar telemetry series of one node for client-side charts."""
+    try:
+        node_id = utils.convert_node_id_from_hex_to_int(node)
+    except ValueError:
+        return jsonify({'error': 'Neplatné ID uzlu'}), 400
+    now = time.time()
+    since = request.args.get('since', default=now - 86400, type=float)
+    since = max(since, now - TELEMETRY_MAX_DAYS * 86400)
+    fields = [
+        field for field in request.args.get(
+            'fields', default=TELEMETRY_DEFAULT_FIELDS
+        ).split(",") if field
+    ]
+    unknown = [field for field in fields if field not in TELEMETRY_FIELDS]
+    if not fields or unknown:
+        return jsonify({'error': f'Neznámé veličiny: {", ".join(unknown)}'}), 400
+    buckets = request.args.get('buckets', type=int)
+    if buckets is not None:
+        buckets = min(max(buckets, 1), TELEMETRY_MAX_BUCKETS)
+    try:
+        md = MeshData()
+        series = md.get_telemetry_series(node_id, fields, since, buckets)
+    except Exception as e:
+        app.logger.error(f"Chyba v /api/node/{node}/telemetry: {e}")
+        return jsonify({'error': 'Interní chyba serveru'}), 500
+    response = jsonify({
+        "id": utils.convert_node_id_from_int_to_hex(node_id),
+        "since": int(since),
+        "fields": fields,
+        **series
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+
+@app.route('/api/events', methods=['GET'])
+def api_events():
+    """Server-sent events with chat, log and node activity updates."""
+    broker = meshinfo_events.get_broker()
+    if not broker.enabled:
+        return jsonify({'error': 'Živé události jsou vypnuté'}), 404
+    last_event_id = request.headers.get(
+        'Last-Event-ID', request.args.get('last_event_id')
+    )
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    topics = request.args.get('topics')
+    sub = broker.subscribe(
+        last_event_id,
+        set(topics.split(",")) if topics else None
+    )
+    if sub is None:
+        return jsonify({'error': 'Příliš mnoho připojení'}), 503
+    return Response(
+        broker.stream(sub),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    return jsonify(meshinfo_metrics.snapshot())
+
+
 @app.route('/api/qr', methods=['GET'])
 def api_qr():
     try:
@@ -188,13 +265,19 @@ def run():
     waitress_logger = logging.getLogger("waitress")
     waitress_logger.setLevel(logging.DEBUG)  # Enable all logs from Waitress
     #  serve(app, host="0.0.0.0", port=port)
+    # Every open event stream holds a waitress thread.
+    threads = config.getint(
+        "webserver", "api_threads",
+        fallback=4 + meshinfo_events.get_broker().max_clients
+    )
     serve(
         TransLogger(
             app,
             setup_console_handler=False,
             logger=waitress_logger
         ),
-        port=port
+        port=port,
+        threads=threads
     )
 
 
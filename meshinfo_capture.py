@@ -0,0 +1,125 @@
+import configparser
+import logging
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MESHCAP1"
+# receive time (unix seconds), topic length, payload length
+RECORD = struct.Struct("<dHI")
+
+
+class CaptureWriter:
+    """Appends received MQTT messages to a capture file for replay.
+
+    The file starts with MAGIC, followed by RECORD headers each followed
+    by the topic (utf-8) and the raw payload. Capturing stops once the
+    file reaches max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        length = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                length = complete_length(path)
+            except ValueError:
+                # Not ours, keep it aside instead of appending to it.
+                moved = f"{path}.{int(time.time())}.bad"
+                os.replace(path, moved)
+                logger.error(f"{path} is not a capture file, moved to {moved}")
+        self.file = open(path, "ab")
+        if length is None:
+            self.file.write(MAGIC)
+        else:
+            # Drop a record cut short by a previous crash.
+            self.file.truncate(length)
+            self.file.seek(0, 2)
+        self.size = self.file.tell()
+        self.full = False
+        logger.info(f"Capturing MQTT messages to {path}")
+
+    @classmethod
+    def from_config(cls, config):
+        path = config.get("mqtt", "capture_file", fallback=None)
+        if not path:
+            return None
+        max_mb = config.getfloat("mqtt", "capture_max_mb", fallback=1024)
+        return cls(path, int(max_mb * 1024 * 1024) if max_mb else None)
+
+    def write(self, ts, topic, payload):
+        topic = topic.encode("utf-8")
+        record = RECORD.pack(ts, len(topic), len(payload)) + topic + payload
+        with self.lock:
+            if self.full:
+                return
+            if self.max_bytes and self.size + len(record) > self.max_bytes:
+                self.full = True
+                self.file.flush()
+                logger.warning(f"Capture file {self.path} is full")
+                return
+            self.file.write(record)
+            self.file.flush()
+            self.size += len(record)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def _records(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{f.name} is not a capture file")
+    while True:
+        header = f.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return
+        ts, topic_length, payload_length = RECORD.unpack(header)
+        topic = f.read(topic_length)
+        payload = f.read(payload_length)
+        if len(topic) < topic_length or len(payload) < payload_length:
+            # Capture interrupted while writing the last record
+            return
+        yield ts, topic.decode("utf-8"), payload
+
+
+def read_capture(path):
+    """(ts, topic, payload) of every complete record in a capture file."""
+    with open(path, "rb") as f:
+        yield from _records(f)
+
+
+def complete_length(path):
+    """Size of the capture up to the end of its last complete record."""
+    with open(path, "rb") as f:
+        length = len(MAGIC)
+        for _ in _records(f):
+            length = f.tell()
+        return length
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_writer_loaded = False
+
+
+def get_writer():
+    """The configured CaptureWriter, or None when capturing is off."""
+    global _writer, _writer_loaded
+    if not _writer_loaded:
+        with _writer_lock:
+            if not _writer_loaded:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                try:
+                    _writer = CaptureWriter.from_config(config)
+                except OSError as e:
+                    # Ingest goes on without capturing.
+                    logger.error(f"Cannot capture MQTT messages: {e}")
+                _writer_loaded = True
+    return _writer
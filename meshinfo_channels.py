@@ -0,0 +1,134 @@
+import base64
+import configparser
+import logging
+import threading
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+import meshinfo_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+# Key the firmware uses for "AQ==" and the other one byte PSKs.
+DEFAULT_PSK = bytes.fromhex("d4f1bb3a20290759f0bcffabcf4e6901")
+DEFAULT_CHANNEL_NAME = "LongFast"
+BACKEND = default_backend()
+
+
+def expand_key(psk):
+    """Turn a configured PSK into AES key bytes, None for no encryption."""
+    if len(psk) == 0:
+        return None
+    if len(psk) == 1:
+        index = psk[0]
+        if index == 0:
+            return None
+        return DEFAULT_PSK[:-1] + bytes([(DEFAULT_PSK[-1] + index - 1) & 0xff])
+    if len(psk) < 16:
+        return psk.ljust(16, b"\0")
+    if 16 < len(psk) < 32:
+        return psk.ljust(32, b"\0")
+    return psk
+
+
+def xor_hash(data):
+    result = 0
+    for byte in data:
+        result ^= byte
+    return result
+
+
+def channel_hash(name, key):
+    """Channel number the firmware puts into encrypted packets."""
+    return xor_hash(name.encode("utf-8")) ^ xor_hash(key or b"")
+
+
+class Channel:
+    def __init__(self, name, psk):
+        self.name = name
+        self.key = expand_key(psk)
+        self.hash = channel_hash(name, self.key)
+        self.algorithm = algorithms.AES(self.key) if self.key else None
+
+    def decrypt(self, packet_id, from_id, encrypted):
+        nonce = packet_id.to_bytes(8, "little") + from_id.to_bytes(8, "little")
+        decryptor = Cipher(
+            self.algorithm, modes.CTR(nonce), backend=BACKEND
+        ).decryptor()
+        return decryptor.update(encrypted) + decryptor.finalize()
+
+
+class ChannelRegistry:
+    """Channel keys by name and by channel hash.
+
+    Packets are routed by the channel_id of the ServiceEnvelope, falling
+    back to the hash in MeshPacket.channel. Without [mesh] channel_name
+    the channel_key is also tried on any other channel, as before named
+    channels existed. Packets of channels without a key are only counted.
+    """
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_hash = {}
+        self.default = None
+        self.fallback = None
+
+    @classmethod
+    def from_config(cls, config):
+        """[mesh] channel_key plus any "name = key" in [channels].
+
+        The parser should keep option case (optionxform = str) as channel
+        names are case sensitive.
+        """
+        registry = cls()
+        name = config.get("mesh", "channel_name", fallback=None)
+        registry.default = registry.add(
+            name or DEFAULT_CHANNEL_NAME,
+            config["mesh"]["channel_key"]
+        )
+        if not name:
+            registry.fallback = registry.default
+            logger.warning(
+                "[mesh] channel_name is not set, trying channel_key on "
+                "every channel without a key of its own"
+            )
+        if config.has_section("channels"):
+            for name, key in config.items("channels"):
+                registry.add(name, key)
+        return registry
+
+    def add(self, name, key):
+        channel = Channel(name, base64.b64decode(key))
+        self.by_name[name] = channel
+        self.by_hash.setdefault(channel.hash, []).append(channel)
+        return channel
+
+    def lookup(self, channel_id, hash_value):
+        channel = self.by_name.get(channel_id)
+        if channel is None:
+            candidates = self.by_hash.get(hash_value)
+            if candidates and len(candidates) == 1:
+                channel = candidates[0]
+        if channel is None:
+            channel = self.fallback
+        if channel is None:
+            metrics.inc("channel_unknown")
+            logger.debug(
+                f"No key for channel '{channel_id}' (hash {hash_value})"
+            )
+        return channel
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                config = configparser.ConfigParser()
+                config.optionxform = str
+                config.read("config.ini")
+                _registry = ChannelRegistry.from_config(config)
+    return _registry
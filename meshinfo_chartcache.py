@@ -0,0 +1,124 @@
+import configparser
+import logging
+import os
+import threading
+from collections import OrderedDict
+import meshinfo_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ChartCache:
+    """Rendered node charts keyed by the data they were drawn from.
+
+    An entry belongs to (node_id, chart) and is valid for one watermark,
+    (newest ts_created, row count). Charts live in a memory LRU bounded
+    by max_bytes and, when a directory is given, in one file per node and
+    chart so they survive restarts.
+    """
+
+    def __init__(self, enabled=True, max_bytes=32 * 1024 * 1024,
+                 directory=None):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            enabled=config.getboolean("cache", "charts", fallback=True),
+            max_bytes=int(
+                config.getfloat("cache", "charts_max_mb", fallback=32)
+                * 1024 * 1024
+            ),
+            directory=config.get("cache", "charts_dir", fallback=None) or None
+        )
+
+    @staticmethod
+    def _stamp(watermark):
+        ts, count = watermark
+        return f"{ts}:{count}"
+
+    def _path(self, node_id, chart):
+        return os.path.join(self.directory, f"{node_id:08x}_{chart}.b64")
+
+    def _store(self, key, stamp, image):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= len(old[1])
+            self.entries[key] = (stamp, image)
+            self.size += len(image)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                metrics.inc("chart_cache_evictions")
+            metrics.set_gauge("chart_cache_bytes", self.size)
+
+    def _read_disk(self, node_id, chart, stamp):
+        try:
+            with open(self._path(node_id, chart)) as f:
+                if f.readline().rstrip("\n") != stamp:
+                    return None
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, node_id, chart, stamp, image):
+        path = self._path(node_id, chart)
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp_file, "w") as f:
+                f.write(stamp + "\n")
+                f.write(image)
+            os.replace(tmp_file, path)
+        except OSError as e:
+            logger.warning(f"Cannot write chart cache file {path}: {e}")
+
+    def get(self, node_id, chart, watermark):
+        if not self.enabled:
+            return None
+        key = (node_id, chart)
+        stamp = self._stamp(watermark)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                metrics.inc("chart_cache_hits")
+                return entry[1]
+        if self.directory:
+            image = self._read_disk(node_id, chart, stamp)
+            if image is not None:
+                self._store(key, stamp, image)
+                metrics.inc("chart_cache_disk_hits")
+                return image
+        metrics.inc("chart_cache_misses")
+        return None
+
+    def put(self, node_id, chart, watermark, image):
+        if not self.enabled or image is None:
+            return
+        stamp = self._stamp(watermark)
+        self._store((node_id, chart), stamp, image)
+        if self.directory:
+            self._write_disk(node_id, chart, stamp, image)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _cache = ChartCache.from_config(config)
+    return _cache
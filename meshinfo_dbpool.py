@@ -0,0 +1,228 @@
+import collections
+import configparser
+import logging
+import threading
+import time
+import mysql.connector
+from mysql.connector import errors
+import meshinfo_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors after which MySQL has rolled back the whole transaction:
+# lock wait timeout, deadlock, server gone away, lost connection.
+TRANSACTION_ERRORS = (1205, 1213, 2006, 2013)
+
+
+def is_transaction_error(e):
+    return isinstance(e, errors.Error) and e.errno in TRANSACTION_ERRORS
+
+
+class CountingCursor:
+    """Cursor proxy that counts executed statements in db_statements."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, *args, **kwargs):
+        metrics.inc("db_statements")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        metrics.inc("db_statements")
+        return self._cursor.executemany(*args, **kwargs)
+
+
+class PooledConnection:
+    """Proxy around a pooled MySQL connection; close() hands it back."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._checked_out = time.monotonic()
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise errors.OperationalError("Connection returned to pool")
+        return getattr(conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs))
+
+    def close(self):
+        conn = self.__dict__.get("_conn")
+        if conn is not None:
+            self._conn = None
+            self._pool.release(conn, self._checked_out)
+
+    def __del__(self):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, size=10, timeout=30, ping_interval=60, **connect_args):
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.connect_args = connect_args
+        self._idle = collections.deque()
+        self._created = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config, **overrides):
+        connect_args = {
+            "host": config["database"]["host"],
+            "user": config["database"]["username"],
+            "password": config["database"]["password"],
+            "database": config["database"]["database"],
+            "charset": "utf8mb4"
+        }
+        connect_args.update(overrides)
+        return cls(
+            size=config.getint("database", "pool_size", fallback=10),
+            timeout=config.getfloat("database", "pool_timeout", fallback=30),
+            ping_interval=config.getfloat(
+                "database", "pool_ping_interval", fallback=60
+            ),
+            **connect_args
+        )
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.connect_args)
+        cur = conn.cursor()
+        cur.execute("SET NAMES utf8mb4;")
+        cur.close()
+        metrics.inc("db_pool_connects")
+        return conn
+
+    def _is_alive(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+        metrics.inc("db_pool_discarded")
+
+    def _update_gauges(self):
+        metrics.set_gauge("db_pool_size", self._created)
+        metrics.set_gauge("db_pool_idle", len(self._idle))
+
+    def get_connection(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+        last_used = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.inc("db_pool_timeouts")
+                    raise errors.PoolError(
+                        f"No connection available within {self.timeout}s"
+                    )
+                self._cond.wait(remaining)
+            self._update_gauges()
+        metrics.observe("db_pool_wait_seconds", time.monotonic() - start)
+
+        if conn is not None and \
+                time.monotonic() - last_used > self.ping_interval and \
+                not self._is_alive(conn):
+            logger.info("Dropping stale database connection")
+            metrics.inc("db_pool_stale")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn, checked_out=None):
+        if checked_out is not None:
+            metrics.observe(
+                "db_pool_checkout_seconds",
+                time.monotonic() - checked_out
+            )
+        try:
+            # End any open transaction so the next user gets a fresh snapshot.
+            conn.rollback()
+        except Exception as e:
+            logger.warning(f"Discarding broken database connection: {e}")
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._update_gauges()
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._created -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._update_gauges()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(**overrides):
+    """Create the process-wide pool, optionally overriding connect args."""
+    global _pool
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool.from_config(config, **overrides)
+    return _pool
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _pool = ConnectionPool.from_config(config)
+    return _pool
+
+
+def get_connection():
+    return get_pool().get_connection()
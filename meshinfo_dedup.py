@@ -0,0 +1,74 @@
+import configparser
+import threading
+import time
+from collections import OrderedDict
+import meshinfo_metrics as metrics
+
+
+class PacketCache:
+    """Recently seen (from, id) pairs, bounded by size and age.
+
+    The same packet reaches MQTT once per gateway that heard it. Only the
+    first copy is stored; later copies just count as seen via their
+    gateway.
+    """
+
+    def __init__(self, enabled=True, size=20000, ttl=600):
+        self.enabled = enabled
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            enabled=config.getboolean("ingest", "dedup", fallback=True),
+            size=config.getint("ingest", "dedup_size", fallback=20000),
+            ttl=config.getfloat("ingest", "dedup_ttl", fallback=600)
+        )
+
+    def _expire(self, now):
+        while self.entries:
+            key, seen = next(iter(self.entries.items()))
+            if now - seen <= self.ttl and len(self.entries) <= self.size:
+                break
+            self.entries.popitem(last=False)
+
+    def is_duplicate(self, from_id, packet_id):
+        """Remember the packet and tell whether it was seen before."""
+        if not self.enabled or not packet_id:
+            return False
+        key = (from_id, packet_id)
+        now = time.monotonic()
+        with self.lock:
+            seen = self.entries.get(key)
+            duplicate = seen is not None and now - seen <= self.ttl
+            if duplicate:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.entries[key] = now
+                self.entries.move_to_end(key)
+                self._expire(now)
+            ratio = self.hits / (self.hits + self.misses)
+        metrics.inc("dedup_hits" if duplicate else "dedup_misses")
+        metrics.set_gauge("dedup_hit_ratio", round(ratio, 4))
+        return duplicate
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _cache = PacketCache.from_config(config)
+    return _cache
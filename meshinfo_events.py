@@ -0,0 +1,154 @@
+import configparser
+import json
+import threading
+from collections import deque
+import meshinfo_metrics as metrics
+
+
+def format_event(event_id, event, data):
+    """One text/event-stream frame."""
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """Pending frames of one client, at most size of them.
+
+    A client that falls further behind loses its backlog and gets a
+    reset event instead, telling it to reload the full state.
+    """
+
+    def __init__(self, topics, size):
+        self.topics = topics
+        self.size = size
+        self.frames = deque()
+        self.reset = False
+        self.last_id = 0
+        self.cond = threading.Condition()
+
+    def wants(self, event):
+        return self.topics is None or event in self.topics
+
+    def push(self, event_id, frame):
+        with self.cond:
+            if len(self.frames) >= self.size:
+                self.frames.clear()
+                self.reset = True
+                metrics.inc("events_client_overflows")
+            self.frames.append(frame)
+            self.last_id = event_id
+            self.cond.notify()
+
+    def next(self, timeout):
+        """Frames queued since the last call, waiting up to timeout."""
+        with self.cond:
+            if not self.frames and not self.reset:
+                self.cond.wait(timeout)
+            frames = list(self.frames)
+            if self.reset:
+                frames = [format_event(self.last_id, "reset", "{}")]
+                self.reset = False
+            self.frames.clear()
+            return frames
+
+
+class EventBroker:
+    """Fan-out of ingest events to server-sent event clients.
+
+    Each event is serialized once on publish and handed to every
+    subscription. The last history events are kept so a reconnecting
+    client can resume from its Last-Event-ID; if that is no longer in
+    the history it gets a reset event.
+    """
+
+    def __init__(self, enabled=True, history=1000, client_buffer=256,
+                 heartbeat=15, max_clients=64):
+        self.enabled = enabled
+        self.history = deque(maxlen=history)
+        self.client_buffer = client_buffer
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.subscriptions = set()
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            enabled=config.getboolean("events", "enabled", fallback=True),
+            history=config.getint("events", "history", fallback=1000),
+            client_buffer=config.getint(
+                "events", "client_buffer", fallback=256
+            ),
+            heartbeat=config.getfloat("events", "heartbeat", fallback=15),
+            max_clients=config.getint("events", "max_clients", fallback=64)
+        )
+
+    def publish(self, event, data):
+        if not self.enabled:
+            return
+        payload = json.dumps(data)
+        with self.lock:
+            self.last_id += 1
+            frame = format_event(self.last_id, event, payload)
+            self.history.append((self.last_id, event, frame))
+            subscriptions = [
+                sub for sub in self.subscriptions if sub.wants(event)
+            ]
+            for sub in subscriptions:
+                sub.push(self.last_id, frame)
+        metrics.inc("events_published")
+        metrics.inc("events_delivered", len(subscriptions))
+
+    def subscribe(self, last_event_id=None, topics=None):
+        """New subscription, or None when max_clients are connected.
+
+        With last_event_id, the events after it are queued right away.
+        """
+        sub = Subscription(topics, self.client_buffer)
+        with self.lock:
+            if len(self.subscriptions) >= self.max_clients:
+                metrics.inc("events_rejected")
+                return None
+            if last_event_id is not None:
+                oldest = self.history[0][0] if self.history else \
+                    self.last_id + 1
+                if last_event_id + 1 < oldest or last_event_id > self.last_id:
+                    sub.reset = True
+                    sub.last_id = self.last_id
+                else:
+                    for event_id, event, frame in self.history:
+                        if event_id > last_event_id and sub.wants(event):
+                            sub.push(event_id, frame)
+            self.subscriptions.add(sub)
+            metrics.set_gauge("events_clients", len(self.subscriptions))
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscriptions.discard(sub)
+            metrics.set_gauge("events_clients", len(self.subscriptions))
+
+    def stream(self, sub):
+        """text/event-stream body for a subscription, with heartbeats."""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                frames = sub.next(self.heartbeat)
+                yield "".join(frames) if frames else ": ping\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _broker = EventBroker.from_config(config)
+    return _broker
@@ -0,0 +1,198 @@
+import configparser
+import logging
+import queue
+import threading
+import time
+from meshtastic import mqtt_pb2
+import meshinfo_metrics as metrics
+from meshdata import MeshData
+from meshinfo_dbpool import is_transaction_error
+from process_payload import decode_payload
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class IngestPipeline:
+    """Bounded queues between the MQTT callback and the database writers.
+
+    on_message only enqueues the raw payload; worker threads decode the
+    packets and write them in micro-batches, one transaction per batch
+    with a savepoint per packet. Packets are sharded by sending node, so
+    the packets of one node are written in the order they arrived.
+    """
+
+    def __init__(self, queue_size=10000, workers=2, batch_size=50,
+                 batch_window=0.5, enqueue_timeout=1.0, retries=3):
+        self.queue_size = queue_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = retries
+        self.queues = []
+        self.threads = []
+        self.dropped = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            queue_size=config.getint("ingest", "queue_size", fallback=10000),
+            workers=config.getint("ingest", "workers", fallback=2),
+            batch_size=config.getint("ingest", "batch_size", fallback=50),
+            batch_window=config.getfloat(
+                "ingest", "batch_window", fallback=0.5
+            ),
+            enqueue_timeout=config.getfloat(
+                "ingest", "enqueue_timeout", fallback=1.0
+            ),
+            retries=config.getint("ingest", "retries", fallback=3)
+        )
+
+    def start(self):
+        for i in range(self.workers):
+            q = queue.Queue(maxsize=max(1, self.queue_size // self.workers))
+            thread = threading.Thread(
+                target=self._worker,
+                args=(q, ),
+                name=f"ingest-{i}",
+                daemon=True
+            )
+            self.queues.append(q)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(
+            f"Ingest pipeline started with {self.workers} workers, "
+            f"queue size {self.queue_size}"
+        )
+
+    def _shard(self, payload):
+        if len(self.queues) == 1:
+            return self.queues[0]
+        try:
+            from_id = getattr(
+                mqtt_pb2.ServiceEnvelope.FromString(payload).packet, "from"
+            )
+        except Exception:
+            from_id = 0
+        return self.queues[from_id % len(self.queues)]
+
+    def depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def join(self):
+        """Wait until every submitted packet has been written."""
+        for q in self.queues:
+            q.join()
+
+    def submit(self, payload, topic):
+        item = (payload, topic, time.monotonic())
+        q = self._shard(payload)
+        try:
+            q.put_nowait(item)
+        except queue.Full:
+            # Backpressure: block the MQTT loop for a while before dropping.
+            metrics.inc("ingest_overflow")
+            try:
+                q.put(item, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self.dropped += 1
+                metrics.inc("ingest_dropped")
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(
+                        f"Ingest queue full, {self.dropped} packets dropped"
+                    )
+                return False
+        metrics.inc("ingest_enqueued")
+        metrics.set_gauge("ingest_queue_depth", self.depth())
+        return True
+
+    def _next_batch(self, q):
+        batch = [q.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self, q):
+        while True:
+            batch = self._next_batch(q)
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                metrics.inc("ingest_batch_errors")
+                logger.error(f"Failed to write batch of {len(batch)}: {e}")
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    def write_batch(self, batch):
+        start = time.monotonic()
+        packets = []
+        for payload, topic, received in batch:
+            metrics.observe("ingest_queue_seconds", start - received)
+            try:
+                data = decode_payload(payload, topic)
+            except Exception as e:
+                metrics.inc("ingest_errors")
+                logger.error(f"Failed to decode packet: {e}")
+                continue
+            if data:
+                packets.append((data, topic, payload))
+        # Decoding marks packets as seen by the dedup cache, so a retry
+        # only repeats the writes.
+        for attempt in range(1, self.retries + 1):
+            try:
+                self._store(packets)
+                break
+            except Exception as e:
+                if not is_transaction_error(e) or attempt == self.retries:
+                    raise
+                metrics.inc("ingest_retries")
+                logger.warning(
+                    f"Batch of {len(packets)} rolled back ({e}), retrying"
+                )
+        metrics.inc("ingest_processed", len(batch))
+        metrics.observe("ingest_batch_size", len(batch), BATCH_SIZE_BUCKETS)
+        metrics.observe("ingest_batch_seconds", time.monotonic() - start)
+        metrics.set_gauge("ingest_queue_depth", self.depth())
+
+    def _store(self, packets):
+        md = MeshData()
+        try:
+            with md.transaction():
+                for data, topic, payload in packets:
+                    try:
+                        with md.savepoint():
+                            md.store(data, topic, raw=payload)
+                    except Exception as e:
+                        if is_transaction_error(e):
+                            raise
+                        metrics.inc("ingest_errors")
+                        logger.error(f"Failed to process packet: {e}")
+        finally:
+            md.close()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                pipeline = IngestPipeline.from_config(config)
+                pipeline.start()
+                _pipeline = pipeline
+    return _pipeline
@@ -0,0 +1,201 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import meshinfo_geo
+import utils
+from meshinfo_los_profile import (
+    LOSProfile,
+    extended_line,
+    render_los_profile
+)
+
+logger = logging.getLogger(__name__)
+
+PROFILE_POINTS = 150
+MIN_DISTANCE = 1000
+MAX_DISTANCE = 50000
+
+
+def node_coords(node, strict):
+    """(lat, lon, alt) of a node, or None when LOSProfile would skip it.
+
+    The node a page belongs to needs a position with an altitude, the
+    other end of a link also a non-negative one, as in get_profiles().
+    """
+    position = node.get("position")
+    if not position:
+        return None
+    lat = position.get("latitude")
+    lon = position.get("longitude")
+    alt = position.get("altitude")
+    if strict:
+        if None in (lat, lon, alt) or alt < 0:
+            return None
+    elif "latitude" not in position or alt is None:
+        # Without an altitude the profile cannot be drawn at all.
+        return None
+    return (lat, lon, alt)
+
+
+def node_label(node):
+    return f"{node.get('long_name', '')} ({node.get('short_name', '')})"
+
+
+def find_links(nodes, cache):
+    """Unique neighbor pairs, each with the orientations to render.
+
+    An image "A <=> B" belongs to A's page when A hears B or B hears A,
+    which is exactly what LOSProfile(nodes, A).get_profiles() renders.
+    """
+    pairs = set()
+    for hexid, node in nodes.items():
+        for neighbor in node.get("neighbors", []):
+            other = utils.convert_node_id_from_int_to_hex(
+                neighbor["neighbor_id"]
+            )
+            if other != hexid and other in nodes:
+                pairs.add(tuple(sorted((hexid, other))))
+
+    links = []
+    for id1, id2 in sorted(pairs):
+        orientations = []
+        for mine, theirs in ((id1, id2), (id2, id1)):
+            coord1 = node_coords(nodes[mine], strict=False)
+            coord2 = node_coords(nodes[theirs], strict=True)
+            if coord1 is None or coord2 is None:
+                continue
+            distance = float(meshinfo_geo.geodesic(
+                coord1[0], coord1[1], coord2[0], coord2[1]
+            ))
+            if not distance or not (MIN_DISTANCE < distance < MAX_DISTANCE):
+                continue
+            label = f"{node_label(nodes[mine])} <=> {node_label(nodes[theirs])}"
+            orientations.append({
+                "coord1": coord1,
+                "coord2": coord2,
+                "label": label,
+                "distance": distance,
+                "cache_file": cache.image_path(coord1, coord2, label)
+            })
+        if orientations:
+            links.append(orientations)
+    return links
+
+
+def sample_links(los, links, chunk_size=256):
+    """Terrain and forest along each link, sampled in vectorized chunks.
+
+    Both orientations of a pair run along the same line, so each line is
+    sampled once and reversed for the other direction.
+    """
+    samples = []
+    for start in range(0, len(links), chunk_size):
+        chunk = links[start:start + chunk_size]
+        lines = [
+            extended_line(
+                link[0]["coord1"], link[0]["coord2"], PROFILE_POINTS
+            )
+            for link in chunk
+        ]
+        lats = np.stack([line[0] for line in lines])
+        lons = np.stack([line[1] for line in lines])
+        elevations, forest_mask = los.sample_line(
+            lats.ravel(), lons.ravel()
+        )
+        elevations = np.asarray(elevations).reshape(lats.shape)
+        forest_mask = np.asarray(forest_mask).reshape(lats.shape)
+        samples.extend(zip(elevations, forest_mask))
+    return samples
+
+
+def generate_all(nodes, jobs=None, progress_interval=10):
+    """Render every missing LOS image for the given nodes."""
+    jobs = jobs or os.cpu_count() or 1
+    started = time.monotonic()
+    los = LOSProfile(nodes)
+    if not los.terrain:
+        logger.error("Terrain dataset not loaded, no profiles generated.")
+        return 0
+
+    links = find_links(nodes, los.cache)
+    pending = [
+        link for link in links
+        if any(not os.path.exists(o["cache_file"]) for o in link)
+    ]
+    images = sum(len(link) for link in links)
+    logger.info(
+        f"{len(links)} links, {images} images, "
+        f"{len(pending)} links need rendering"
+    )
+    if not pending:
+        return 0
+
+    tasks = []
+    queued = []
+    for link, (elevations, forest_mask) in zip(
+            pending, sample_links(los, pending)):
+        for orientation in link:
+            if os.path.exists(orientation["cache_file"]):
+                continue
+            # The first orientation defines the sampled line direction.
+            reverse = orientation["coord1"] != link[0]["coord1"]
+            los.cache.put_profile(
+                orientation["coord1"],
+                orientation["coord2"],
+                elevations=elevations[::-1] if reverse else elevations,
+                forest_mask=forest_mask[::-1] if reverse else forest_mask
+            )
+            queued.append(orientation)
+            tasks.append((
+                orientation["cache_file"],
+                orientation["label"],
+                orientation["distance"],
+                PROFILE_POINTS,
+                elevations[::-1] if reverse else elevations,
+                forest_mask[::-1] if reverse else forest_mask,
+                orientation["coord1"][2],
+                orientation["coord2"][2]
+            ))
+    logger.info(
+        f"Sampled terrain for {len(pending)} links in "
+        f"{time.monotonic() - started:.1f}s, rendering {len(tasks)} images "
+        f"with {jobs} processes"
+    )
+
+    done = 0
+    failed = 0
+    render_started = time.monotonic()
+    last_report = render_started
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(render_los_profile, *task): orientation
+            for task, orientation in zip(tasks, queued)
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+                orientation = futures[future]
+                los.cache.put_image(
+                    orientation["coord1"],
+                    orientation["coord2"],
+                    orientation["label"]
+                )
+                done += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error rendering profile: {e}")
+            now = time.monotonic()
+            if now - last_report >= progress_interval or \
+                    done + failed == len(tasks):
+                last_report = now
+                rate = (done + failed) / max(now - render_started, 1e-9)
+                logger.info(
+                    f"Rendered {done + failed}/{len(tasks)} images "
+                    f"({rate:.1f}/s, {failed} failed)"
+                )
+    logger.info(
+        f"Generated {done} images in {time.monotonic() - started:.1f}s"
+    )
+    return done
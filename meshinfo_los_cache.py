@@ -0,0 +1,345 @@
+import argparse
+import configparser
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Coordinates are rounded to ~1 m and altitudes to whole meters before
+# hashing, so noise in reported positions does not create new entries.
+COORD_DECIMALS = 5
+LEGACY_IMAGE = re.compile(r"^[0-9a-f]{32}\.png$")
+# How often a registered image key is written again while pages use it.
+# Keys written within twice that time are never dropped, pages shown
+# meanwhile may still link to them.
+REGISTER_REFRESH = 3600
+
+
+def quantize(coord):
+    lat, lon, alt = coord
+    return (
+        round(float(lat), COORD_DECIMALS),
+        round(float(lon), COORD_DECIMALS),
+        None if alt is None else int(round(alt))
+    )
+
+
+def profile_key(coord1, coord2):
+    """Key of the terrain line from coord1 to coord2 (direction matters)."""
+    text = f"{quantize(coord1)}-{quantize(coord2)}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:24]
+
+
+def image_key(coord1, coord2, label):
+    text = f"{profile_key(coord1, coord2)}-{label}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:24]
+
+
+class LOSCache:
+    """Terrain profiles and rendered images of LOS links.
+
+    Profiles (.npz) only depend on the quantized end points, images
+    (.png) also on the label. Both are listed in a SQLite index with
+    their size and last access; a new image for the same line replaces
+    the previous one, and prune() evicts the least recently used files
+    once the cache grows over its limits. Image keys are dropped with
+    their image, or when no page registered them for max_age_days.
+    """
+
+    def __init__(self, directory="cache/los", max_bytes=None,
+                 max_age_days=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.profile_dir = os.path.join(directory, "profiles")
+        self.image_dir = os.path.join(directory, "images")
+        self.index_file = os.path.join(directory, "index.sqlite")
+        os.makedirs(self.profile_dir, exist_ok=True)
+        os.makedirs(self.image_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    line TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+)""")
+            db.execute("""CREATE INDEX IF NOT EXISTS idx_entries_last_access
+ON entries (last_access)""")
+            db.execute("""CREATE INDEX IF NOT EXISTS idx_entries_line
+ON entries (line, kind)""")
+            # What an image key stands for, so it can be drawn on request
+            db.execute("""CREATE TABLE IF NOT EXISTS images (
+    key TEXT PRIMARY KEY,
+    coord1 TEXT NOT NULL,
+    coord2 TEXT NOT NULL,
+    label TEXT NOT NULL,
+    registered REAL
+)""")
+            columns = [row[1] for row in db.execute("PRAGMA table_info(images)")]
+            if "registered" not in columns:
+                db.execute("ALTER TABLE images ADD COLUMN registered REAL")
+            db.execute("""CREATE INDEX IF NOT EXISTS idx_images_registered
+ON images (registered)""")
+        # image key -> when this process last wrote it
+        self.registered = {}
+
+    @classmethod
+    def from_config(cls, config):
+        max_size_mb = config.getfloat("los_cache", "max_size_mb", fallback=500)
+        return cls(
+            directory=config.get("los_cache", "directory", fallback="cache/los"),
+            max_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb else None,
+            max_age_days=config.getfloat(
+                "los_cache", "max_age_days", fallback=90
+            )
+        )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.index_file, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _touch(self, path):
+        # Only write when the recorded access is older than a minute.
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                """UPDATE entries SET last_access = ?
+WHERE path = ? AND last_access < ?""",
+                (now, path, now - 60)
+            )
+
+    def _record(self, path, kind, line):
+        now = time.time()
+        size = os.path.getsize(path)
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT path FROM entries WHERE line = ? AND kind = ? AND path != ?",
+                (line, kind, path)
+            ).fetchall()
+            db.execute(
+                """INSERT OR REPLACE INTO entries
+(path, kind, line, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)""",
+                (path, kind, line, size, now, now)
+            )
+            # Older images of the same line (e.g. before a node was renamed)
+            for (old_path, ) in rows:
+                self._remove(db, old_path)
+
+    def _remove(self, db, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        db.execute("DELETE FROM entries WHERE path = ?", (path, ))
+        if os.path.dirname(path) == self.image_dir:
+            db.execute(
+                """DELETE FROM images WHERE key = ?
+AND (registered IS NULL OR registered < ?)""",
+                (
+                    os.path.basename(path)[:-len(".png")],
+                    time.time() - 2 * REGISTER_REFRESH
+                )
+            )
+
+    def image_path(self, coord1, coord2, label):
+        return self.image_file(image_key(coord1, coord2, label))
+
+    def image_file(self, key):
+        return os.path.join(self.image_dir, key + ".png")
+
+    def find_image(self, key):
+        """Path of the image with the given key if it was rendered."""
+        path = self.image_file(key)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def register_image(self, coord1, coord2, label):
+        """Remember the parameters of an image; returns its key."""
+        key = image_key(coord1, coord2, label)
+        now = time.time()
+        if now - self.registered.get(key, 0) > REGISTER_REFRESH:
+            with self._connect() as db:
+                db.execute(
+                    """INSERT INTO images (key, coord1, coord2, label, registered)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET registered = excluded.registered""",
+                    (key, json.dumps(coord1), json.dumps(coord2), label, now)
+                )
+            self.registered[key] = now
+        return key
+
+    def image_params(self, key):
+        """(coord1, coord2, label) of a registered image, or None."""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT coord1, coord2, label FROM images WHERE key = ?",
+                (key, )
+            ).fetchone()
+        if not row:
+            return None
+        return tuple(json.loads(row[0])), tuple(json.loads(row[1])), row[2]
+
+    def get_image(self, coord1, coord2, label):
+        """Path of the rendered image, or None if it has to be drawn."""
+        path = self.image_path(coord1, coord2, label)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def put_image(self, coord1, coord2, label):
+        """Index an image written to image_path()."""
+        path = self.image_path(coord1, coord2, label)
+        self._record(path, "image", profile_key(coord1, coord2))
+        return path
+
+    def profile_path(self, coord1, coord2):
+        return os.path.join(
+            self.profile_dir, profile_key(coord1, coord2) + ".npz"
+        )
+
+    def get_profile(self, coord1, coord2):
+        path = self.profile_path(coord1, coord2)
+        try:
+            with np.load(path) as data:
+                profile = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        self._touch(path)
+        return profile
+
+    def put_profile(self, coord1, coord2, **arrays):
+        path = self.profile_path(coord1, coord2)
+        tmp_file = f"{path}.{os.getpid()}.npz"
+        np.savez_compressed(tmp_file, **arrays)
+        os.replace(tmp_file, path)
+        self._record(path, "profile", profile_key(coord1, coord2))
+        return path
+
+    def stats(self):
+        with self._connect() as db:
+            rows = db.execute("""SELECT kind, COUNT(*), SUM(size),
+MIN(last_access), MAX(last_access) FROM entries GROUP BY kind""").fetchall()
+        return {
+            kind: {
+                "files": count,
+                "bytes": size or 0,
+                "oldest_access": oldest,
+                "newest_access": newest
+            }
+            for kind, count, size, oldest, newest in rows
+        }
+
+    def prune(self, max_bytes=None, max_age_days=None):
+        """Evict least recently used files; returns (files, bytes) freed."""
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        max_age_days = max_age_days if max_age_days is not None \
+            else self.max_age_days
+        removed = 0
+        freed = 0
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT path, size, last_access FROM entries ORDER BY last_access"
+            ).fetchall()
+            total = sum(row[1] for row in rows)
+            cutoff = time.time() - max_age_days * 86400 \
+                if max_age_days else None
+            for path, size, last_access in rows:
+                missing = not os.path.exists(path)
+                expired = cutoff is not None and last_access < cutoff
+                too_big = max_bytes is not None and total > max_bytes
+                if not (missing or expired or too_big):
+                    continue
+                self._remove(db, path)
+                total -= size
+                removed += 1
+                freed += 0 if missing else size
+            if cutoff is not None:
+                db.execute(
+                    """DELETE FROM images
+WHERE registered IS NULL OR registered < ?""",
+                    (min(cutoff, time.time() - 2 * REGISTER_REFRESH), )
+                )
+        logger.info(f"Pruned {removed} LOS cache files ({freed} bytes)")
+        return removed, freed
+
+    def prune_legacy(self, directory="cache"):
+        """Delete <md5>.png images written before the index existed."""
+        removed = 0
+        freed = 0
+        for path in glob.glob(os.path.join(directory, "*.png")):
+            if LEGACY_IMAGE.match(os.path.basename(path)):
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+        return removed, freed
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _cache = LOSCache.from_config(config)
+    return _cache
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="LOS profile cache")
+    parser.add_argument("command", choices=["stats", "prune"])
+    parser.add_argument("--max-size-mb", type=float)
+    parser.add_argument("--max-age-days", type=float)
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="also delete old cache/<md5>.png images"
+    )
+    args = parser.parse_args()
+    cache = get_cache()
+    if args.command == "stats":
+        for kind, info in sorted(cache.stats().items()):
+            print(
+                f"{kind:<8} {info['files']:>7} files "
+                f"{info['bytes'] / 1024 / 1024:9.1f} MB  last access "
+                f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(info['oldest_access']))}"
+                f" .. {time.strftime('%Y-%m-%d %H:%M', time.localtime(info['newest_access']))}"
+            )
+        legacy = [
+            path for path in glob.glob("cache/*.png")
+            if LEGACY_IMAGE.match(os.path.basename(path))
+        ]
+        print(f"legacy   {len(legacy):>7} files in cache/")
+    else:
+        max_bytes = int(args.max_size_mb * 1024 * 1024) \
+            if args.max_size_mb is not None else None
+        files, freed = cache.prune(max_bytes, args.max_age_days)
+        print(f"Removed {files} files, {freed / 1024 / 1024:.1f} MB")
+        if args.legacy:
+            files, freed = cache.prune_legacy()
+            print(f"Removed {files} legacy images, {freed / 1024 / 1024:.1f} MB")
@@ -1,50 +1,119 @@
 import json
 import utils
 import os
-import rasterio
+import meshinfo_geo
+import meshinfo_los_cache
+import meshinfo_terrain
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
 from matplotlib.ticker import MaxNLocator
 from scipy.spatial import distance
-from geopy.distance import geodesic
 import logging
 import time
 import io
 import re
 import base64
-import hashlib
+
+EXTEND_RATIO = 0.05
+
+
+def extended_line(coord1, coord2, num_points):
+    """Body spojnice prodloužené o EXTEND_RATIO za obě antény."""
+    extra_points = int(num_points * EXTEND_RATIO)
+    total_points = num_points + 2 * extra_points
+
+    lat1, lon1, _ = coord1
+    lat2, lon2, _ = coord2
+    extra_lat_start = lat1 - (lat2 - lat1) * EXTEND_RATIO
+    extra_lon_start = lon1 - (lon2 - lon1) * EXTEND_RATIO
+    extra_lat_end = lat2 + (lat2 - lat1) * EXTEND_RATIO
+    extra_lon_end = lon2 + (lon2 - lon1) * EXTEND_RATIO
+
+    lats = np.linspace(extra_lat_start, extra_lat_end, total_points)
+    lons = np.linspace(extra_lon_start, extra_lon_end, total_points)
+    return lats, lons
+
+
+def render_los_profile(cache_file, label, total_distance, num_points,
+                       elevations, forest_mask, alt1, alt2,
+                       dynamic_range=True):
+    """Vykreslí profil do cache_file.
+
+    Bere jen hotová data, takže ji lze spustit i v jiném procesu.
+    """
+    extra_points = int(num_points * EXTEND_RATIO)
+    total_points = num_points + 2 * extra_points
+
+    extended_distances = np.linspace(-extra_points, num_points + extra_points - 1, total_points)
+    extended_distances_km = [(d / (num_points - 1)) * total_distance / 1000.0 for d in extended_distances]
+
+    elevations = np.array(elevations)
+    # Vložíme výšky antén na správné pozice
+    elevations[extra_points] = alt1
+    elevations[-extra_points - 1] = alt2
+
+    # Spojovací čára pouze mezi anténami
+    direct_line = np.linspace(alt1, alt2, num_points)
+
+    plt.figure(figsize=(10, 3))
+    ax = plt.gca()
+    ax.set_facecolor("#f0f4f8")
+    plt.margins(x=0, y=0, tight=True)
+
+    all_heights = list(elevations) + list(direct_line)
+    min_y = min(all_heights)
+    max_y = max(all_heights)
+
+    if dynamic_range:
+        padding = (max_y - min_y) * 0.2
+        plt.ylim(bottom=max(0, min_y - padding), top=max_y + padding)
+    else:
+        plt.ylim(bottom=max(0, min_y - 50))
+
+    plt.fill_between(extended_distances_km, elevations, color="#d08770", alpha=0.8, zorder=3, label="Profil terénu")
+    plt.plot(extended_distances_km, elevations, color="#a0522d", linewidth=1.5, zorder=4, label="Obrys terénu")
+
+    # Přidání napůl průhledné zelené oblasti na místech lesů
+    for i in range(len(elevations) - 1):
+        if forest_mask[i]:
+            plt.fill_between(
+                [extended_distances_km[i], extended_distances_km[i + 1]],
+                elevations[i] - 1,
+                elevations[i] + 5,
+                color="green",
+                alpha=0.4,
+                edgecolor="none",
+                zorder=1
+            )
+
+    main_distances_km = extended_distances_km[extra_points: -extra_points]
+    plt.plot(main_distances_km, direct_line, color="#2e8b57", linestyle="dashed", linewidth=2, zorder=5, label="Přímá spojnice")
+    plt.scatter([main_distances_km[0], main_distances_km[-1]], [alt1, alt2], color="black", zorder=5)
+
+    clean_label = LOSProfile.remove_emoji(label)
+
+    plt.xlabel("Vzdálenost (km)")
+    plt.ylabel("Nadmořská výška (metry)")
+    plt.title(clean_label, fontsize=12, fontweight="bold")
+
+    plt.grid(True, linestyle="--", linewidth=0.5, alpha=0.6)
+    plt.legend(loc="upper right", fontsize=9)
+
+    plt.savefig(cache_file, format="png", bbox_inches="tight")
+    plt.close()
+
 
 class LOSProfile():
     def __init__(self, nodes={}, node=None):
         self.nodes = nodes
         self.node = node
-        self.terrain_dataset = None  # Dataset pro terén
-        self.forest_dataset = None  # Dataset pro lesy
-
-        # Názvy souborů pro terén a lesy
-        terrain_file = "srtm_data/terrain_data.tif"
-        forest_file = "srtm_data/forest_data.tif"
-
-        # Načtení datasetu terénu
-        try:
-            if os.path.exists(terrain_file):
-                self.terrain_dataset = rasterio.open(terrain_file)
-            else:
-                logging.warning(f"Terrain file '{terrain_file}' not found.")
-        except Exception as e:
-            logging.error(f"Error loading terrain file '{terrain_file}': {e}")
-
-        # Načtení datasetu lesů
-        try:
-            if os.path.exists(forest_file):
-                self.forest_dataset = rasterio.open(forest_file)
-            else:
-                logging.warning(f"Forest file '{forest_file}' not found.")
-        except Exception as e:
-            logging.error(f"Error loading forest file '{forest_file}': {e}")
-
+        # Rastry terénu a lesů sdílené celým procesem
+        store = meshinfo_terrain.get_store()
+        self.terrain = store.terrain
+        self.forest = store.forest
+        self.cache = meshinfo_los_cache.get_cache()
 
     @staticmethod
     def remove_emoji(text):
@@ -65,31 +134,24 @@ class LOSProfile():
     def calculate_distance_between_coords(self, coord1, coord2):
         lat1, lon1 = coord1
         lat2, lon2 = coord2
-        return geodesic((lat1, lon1), (lat2, lon2)).meters
+        return float(meshinfo_geo.geodesic(lat1, lon1, lat2, lon2))
 
     def read_elevation_from_tif(self, lat, lon):
         """Čtení výšky z datasetu terénu."""
-        if not self.terrain_dataset:
+        if not self.terrain:
             logging.warning("Terrain dataset not loaded.")
             return None
-        if self.terrain_dataset.bounds.left <= lon <= self.terrain_dataset.bounds.right and \
-           self.terrain_dataset.bounds.bottom <= lat <= self.terrain_dataset.bounds.top:
-            row, col = self.terrain_dataset.index(lon, lat)
-            elevation = self.terrain_dataset.read(1)[row, col]
-            return elevation
-        logging.warning(f"No elevation data found for coordinates ({lat}, {lon})")
-        return None
+        elevation = self.terrain.value(lat, lon)
+        if elevation is None:
+            logging.warning(f"No elevation data found for coordinates ({lat}, {lon})")
+        return elevation
 
     def read_forest_from_tif(self, lat, lon):
         """Zjištění, zda je bod pokryt lesem."""
-        if not self.forest_dataset:
+        if not self.forest:
             return False  # Pokud dataset neexistuje, žádné lesy nejsou
-        if self.forest_dataset.bounds.left <= lon <= self.forest_dataset.bounds.right and \
-           self.forest_dataset.bounds.bottom <= lat <= self.forest_dataset.bounds.top:
-            row, col = self.forest_dataset.index(lon, lat)
-            forest_value = self.forest_dataset.read(1)[row, col]
-            return forest_value > 0  # Např. hodnota > 0 znamená les
-        return False
+        forest_value = self.forest.value(lat, lon)
+        return forest_value is not None and forest_value > 0  # Např. hodnota > 0 znamená les
 
     def get_profile_between(self, from_coords, to_coords, resolution=150):
         lat1, lon1 = from_coords["lat"], from_coords["lon"]
@@ -101,13 +163,8 @@ class LOSProfile():
         total_distance = self.calculate_distance_between_coords((lat1, lon1), (lat2, lon2))
 
         # Optimalizace: načti výšky hromadně
-        if self.terrain_dataset:
-            from rasterio.transform import rowcol
-            rows, cols = rowcol(self.terrain_dataset.transform, lons, lats)
-            rows = np.clip(rows, 0, self.terrain_dataset.height - 1)
-            cols = np.clip(cols, 0, self.terrain_dataset.width - 1)
-            elevation_data = self.terrain_dataset.read(1)
-            elevations = elevation_data[rows, cols]
+        if self.terrain:
+            elevations = self.terrain.sample(lats, lons)
         else:
             elevations = np.zeros_like(lats)
 
@@ -130,17 +187,12 @@ class LOSProfile():
         longitudes = np.linspace(lon1, lon2, resolution)
 
         # Optimalizace: načti výšky hromadně
-        if self.terrain_dataset:
-            from rasterio.transform import rowcol
-            rows, cols = rowcol(self.terrain_dataset.transform, longitudes, latitudes)
-            rows = np.clip(rows, 0, self.terrain_dataset.height - 1)
-            cols = np.clip(cols, 0, self.terrain_dataset.width - 1)
-            elevation_data = self.terrain_dataset.read(1)
-            elevations = elevation_data[rows, cols]
+        if self.terrain:
+            elevations = self.terrain.sample(latitudes, longitudes)
         else:
             elevations = np.zeros_like(latitudes)
 
-        distances = [geodesic((lat1, lon1), (lat, lon)).meters for lat, lon in zip(latitudes, longitudes)]
+        distances = meshinfo_geo.geodesic(lat1, lon1, latitudes, longitudes).tolist()
         profile = [float(elev) for elev in elevations]
 
         if alt1:
@@ -150,121 +202,71 @@ class LOSProfile():
 
         return distances, profile
 
-    def _get_cache_filename(self, coord1, coord2, label):
-        os.makedirs("cache", exist_ok=True)
-        hash_input = f"{coord1}-{coord2}-{label}".encode("utf-8")
-        filename = hashlib.md5(hash_input).hexdigest() + ".png"
-        return os.path.join("cache", filename)
-
-    def plot_los_profile(self, distances, profile, label, dynamic_range=True, coord1=None, coord2=None):
-        cache_file = self._get_cache_filename(coord1, coord2, label)
-
-        if os.path.exists(cache_file):
-            with open(cache_file, "rb") as f:
-                img_base64 = base64.b64encode(f.read()).decode("utf-8")
-                return img_base64
-
-        extend_ratio = 0.05
-        num_points = len(profile)
-        extra_points = int(num_points * extend_ratio)
-        total_points = num_points + 2 * extra_points
-
-        extended_distances = np.linspace(-extra_points, num_points + extra_points - 1, total_points)
-        extended_distances_km = [(d / (num_points - 1)) * distances[-1] / 1000.0 for d in extended_distances]
-
-        lat1, lon1, alt1 = coord1
-        lat2, lon2, alt2 = coord2
-        extra_lat_start = lat1 - (lat2 - lat1) * extend_ratio
-        extra_lon_start = lon1 - (lon2 - lon1) * extend_ratio
-        extra_lat_end = lat2 + (lat2 - lat1) * extend_ratio
-        extra_lon_end = lon2 + (lon2 - lon1) * extend_ratio
-
-        lats = np.linspace(extra_lat_start, extra_lat_end, total_points)
-        lons = np.linspace(extra_lon_start, extra_lon_end, total_points)
-
-        # --- Optimalizace: vektorové čtení výšek a masky lesa ---
+    def sample_line(self, lats, lons):
+        """Výšky terénu a maska lesa v bodech linie."""
         elevations = np.zeros_like(lats)
         forest_mask = np.zeros_like(lats, dtype=bool)
-        if self.terrain_dataset:
-            from rasterio.transform import rowcol
-            rows, cols = rowcol(self.terrain_dataset.transform, lons, lats)
-            rows = np.clip(rows, 0, self.terrain_dataset.height - 1)
-            cols = np.clip(cols, 0, self.terrain_dataset.width - 1)
-            elevation_data = self.terrain_dataset.read(1)
-            elevations = elevation_data[rows, cols]
-        if self.forest_dataset:
-            from rasterio.transform import rowcol
-            rows, cols = rowcol(self.forest_dataset.transform, lons, lats)
-            rows = np.clip(rows, 0, self.forest_dataset.height - 1)
-            cols = np.clip(cols, 0, self.forest_dataset.width - 1)
-            forest_data = self.forest_dataset.read(1)
-            forest_mask = forest_data[rows, cols] > 0
-
-        # Vložíme výšky antén na správné pozice
-        elevations[extra_points] = alt1
-        elevations[-extra_points - 1] = alt2
-
-        # Spojovací čára pouze mezi anténami
-        direct_line = np.linspace(alt1, alt2, num_points)
-
-        plt.figure(figsize=(10, 3))
-        ax = plt.gca()
-        ax.set_facecolor("#f0f4f8")
-        plt.margins(x=0, y=0, tight=True)
-
-        all_heights = list(elevations) + list(direct_line)
-        min_y = min(all_heights)
-        max_y = max(all_heights)
-
-        if dynamic_range:
-            padding = (max_y - min_y) * 0.2
-            plt.ylim(bottom=max(0, min_y - padding), top=max_y + padding)
+        if self.terrain:
+            elevations = self.terrain.sample(lats, lons)
+        if self.forest:
+            forest_mask = self.forest.sample(lats, lons) > 0
+        return elevations, forest_mask
+
+    def sample_profile(self, coord1, coord2, num_points):
+        """Terén prodloužené spojnice, z cache pokud už byl spočítán."""
+        stored = self.cache.get_profile(coord1, coord2)
+        lats, lons = extended_line(coord1, coord2, num_points)
+        if stored is not None and len(stored["elevations"]) == len(lats):
+            return stored["elevations"], stored["forest_mask"]
+        # --- Optimalizace: vektorové čtení výšek a masky lesa ---
+        elevations, forest_mask = self.sample_line(lats, lons)
+        self.cache.put_profile(
+            coord1, coord2, elevations=elevations, forest_mask=forest_mask
+        )
+        return elevations, forest_mask
+
+    def render_image(self, coord1, coord2, label, distances, num_points, dynamic_range=True, renderer=None):
+        """Vykreslí obrázek, volitelně přes renderer(func, *args) v jiném procesu."""
+        elevations, forest_mask = self.sample_profile(coord1, coord2, num_points)
+        cache_file = self.cache.image_path(coord1, coord2, label)
+        args = (
+            cache_file, label, distances[-1], num_points,
+            elevations, forest_mask, coord1[2], coord2[2], dynamic_range
+        )
+        if renderer:
+            renderer(render_los_profile, *args)
         else:
-            plt.ylim(bottom=max(0, min_y - 50))
-
-        plt.fill_between(extended_distances_km, elevations, color="#d08770", alpha=0.8, zorder=3, label="Profil terénu")
-        plt.plot(extended_distances_km, elevations, color="#a0522d", linewidth=1.5, zorder=4, label="Obrys terénu")
-
-        # Přidání napůl průhledné zelené oblasti na místech lesů
-        for i in range(len(elevations) - 1):
-            if forest_mask[i]:
-                plt.fill_between(
-                    [extended_distances_km[i], extended_distances_km[i + 1]],
-                    elevations[i] - 1,
-                    elevations[i] + 5,
-                    color="green",
-                    alpha=0.4,
-                    edgecolor="none",
-                    zorder=1
-                )
-
-        main_distances_km = extended_distances_km[extra_points: -extra_points]
-        plt.plot(main_distances_km, direct_line, color="#2e8b57", linestyle="dashed", linewidth=2, zorder=5, label="Přímá spojnice")
-        plt.scatter([main_distances_km[0], main_distances_km[-1]], [alt1, alt2], color="black", zorder=5)
-
-        clean_label = self.remove_emoji(label)
-
-        plt.xlabel("Vzdálenost (km)")
-        plt.ylabel("Nadmořská výška (metry)")
-        plt.title(clean_label, fontsize=12, fontweight="bold")
-
-        plt.grid(True, linestyle="--", linewidth=0.5, alpha=0.6)
-        plt.legend(loc="upper right", fontsize=9)
+            render_los_profile(*args)
+        self.cache.put_image(coord1, coord2, label)
+        return cache_file
+
+    def image_file(self, coord1, coord2, label, renderer=None):
+        """Cesta k obrázku profilu, pokud chybí, vykreslí ho."""
+        cache_file = self.cache.get_image(coord1, coord2, label)
+        if cache_file:
+            return cache_file
+        distances, profile = self.generate_los_profile(coord1, coord2)
+        return self.render_image(
+            coord1, coord2, label, distances, len(profile), renderer=renderer
+        )
 
-        plt.savefig(cache_file, format="png", bbox_inches="tight")
-        plt.close()
+    def plot_los_profile(self, distances, profile, label, dynamic_range=True, coord1=None, coord2=None):
+        cache_file = self.cache.get_image(coord1, coord2, label)
+        if not cache_file:
+            cache_file = self.render_image(
+                coord1, coord2, label, distances, len(profile), dynamic_range
+            )
 
         with open(cache_file, "rb") as f:
             img_base64 = base64.b64encode(f.read()).decode("utf-8")
         return img_base64
 
-
     def get_profiles(self):
         profiles = {}
         processed_ids = set()  # <== sledujeme už zpracované uzly
 
         hexid = utils.convert_node_id_from_int_to_hex(self.node)
-        if not self.terrain_dataset or hexid not in self.nodes:
+        if not self.terrain or hexid not in self.nodes:
             return profiles
 
         mynode = self.nodes[hexid]
@@ -307,24 +309,11 @@ class LOSProfile():
                 sname2 = node.get("short_name", "")
                 label = f"{lname1} ({sname1}) <=> {lname2} ({sname2})"
 
-                # Kontrola, zda obrázek již existuje
-                cache_file = self._get_cache_filename(coord1, coord2, label)
-                if os.path.exists(cache_file):
-                    with open(cache_file, "rb") as f:
-                        img_base64 = base64.b64encode(f.read()).decode("utf-8")
-                    profiles[neighbor_id] = {
-                        "image": img_base64,
-                        "distance": dist,
-                        "snr": neighbor.get("snr")
-                    }
-                    processed_ids.add(neighbor_id)
-                    continue
-
-                distances, profile = self.generate_los_profile(coord1, coord2)
-                image = self.plot_los_profile(distances, profile, label, coord1=coord1, coord2=coord2)
-
+                # Obrázek se vykreslí až při prvním stažení z /los/<key>.png
+                key = self.cache.register_image(coord1, coord2, label)
                 profiles[neighbor_id] = {
-                    "image": image,
+                    "url": f"los/{key}.png",
+                    "label": label,
                     "distance": dist,
                     "snr": neighbor.get("snr")
                 }
@@ -360,24 +349,11 @@ class LOSProfile():
                 sname2 = nnode.get("short_name", "")
                 label = f"{lname1} ({sname1}) <=> {lname2} ({sname2})"
 
-                # Kontrola, zda obrázek již existuje
-                cache_file = self._get_cache_filename(coord1, coord2, label)
-                if os.path.exists(cache_file):
-                    with open(cache_file, "rb") as f:
-                        img_base64 = base64.b64encode(f.read()).decode("utf-8")
-                    profiles[id] = {
-                        "image": img_base64,
-                        "distance": dist,
-                        "snr": neighbor.get("snr")
-                    }
-                    processed_ids.add(id)
-                    continue
-
-                distances, profile = self.generate_los_profile(coord1, coord2)
-                image = self.plot_los_profile(distances, profile, label, coord1=coord1, coord2=coord2)
-
+                # Obrázek se vykreslí až při prvním stažení z /los/<key>.png
+                key = self.cache.register_image(coord1, coord2, label)
                 profiles[id] = {
-                    "image": image,
+                    "url": f"los/{key}.png",
+                    "label": label,
                     "distance": dist,
                     "snr": neighbor.get("snr")
                 }
@@ -386,9 +362,8 @@ class LOSProfile():
         return profiles
 
     def find_highest_point(self, lat, lon, perimeter_m=5000):
-        if not self.terrain_dataset:
+        if not self.terrain:
             return None
-        from rasterio.transform import rowcol
         deg_per_m = 1.0 / 111320.0
         step_m = max(5, perimeter_m // 100)
         dists = np.arange(-perimeter_m, perimeter_m + step_m, step_m)
@@ -399,11 +374,7 @@ class LOSProfile():
         lons = lon + grid_dlon * deg_per_m
         lats_masked = lats[mask]
         lons_masked = lons[mask]
-        rows, cols = rowcol(self.terrain_dataset.transform, lons_masked, lats_masked)
-        rows = np.clip(rows, 0, self.terrain_dataset.height - 1)
-        cols = np.clip(cols, 0, self.terrain_dataset.width - 1)
-        elevation_data = self.terrain_dataset.read(1)
-        elevations = elevation_data[rows, cols]
+        elevations = self.terrain.sample(lats_masked, lons_masked)
         if elevations.size == 0:
             return []
         coords = np.column_stack((lats_masked, lons_masked))
@@ -426,7 +397,7 @@ class LOSProfile():
             else:
                 # Vektorově spočítat vzdálenosti ke všem už vybraným bodům
                 prev_coords = np.array([[pt['lat'], pt['lon']] for pt in result])
-                dists = np.array([geodesic((this_lat, this_lon), (lat2, lon2)).meters for lat2, lon2 in prev_coords])
+                dists = meshinfo_geo.haversine(this_lat, this_lon, prev_coords[:, 0], prev_coords[:, 1])
                 if np.all(dists >= 100):
                     result.append({'lat': this_lat, 'lon': this_lon, 'elevation': this_elev})
                     used[idx] = True
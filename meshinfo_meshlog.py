@@ -0,0 +1,97 @@
+import configparser
+import json
+import logging
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# How packets are stored in meshlog:
+#
+#   [meshlog]
+#   format = json        ; pretty printed JSON text in message (default)
+#   format = compact     ; compact JSON, compressed into payload
+#   format = raw         ; the MQTT ServiceEnvelope bytes, decoded on read
+#   compression = zlib   ; zlib, zstd (needs the zstandard package) or none
+#   level = 6
+FORMATS = ("json", "compact", "raw")
+
+
+class MeshlogCodec:
+    """Packs meshlog rows into the payload column and back.
+
+    The encoding column tells how a row was written, so rows of all
+    formats can be read no matter what the current setting is; rows
+    without one are legacy JSON text in message.
+    """
+
+    def __init__(self, format="json", compression="zlib", level=6):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown meshlog format {format}")
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, using zlib")
+            compression = "zlib"
+        if compression not in ("zlib", "zstd", "none"):
+            raise ValueError(f"Unknown meshlog compression {compression}")
+        self.format = format
+        self.compression = compression
+        self.level = level
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            format=config.get("meshlog", "format", fallback="json"),
+            compression=config.get("meshlog", "compression", fallback="zlib"),
+            level=config.getint("meshlog", "level", fallback=6)
+        )
+
+    def pack(self, text, raw=None):
+        """(encoding, payload) for compact JSON text or envelope bytes."""
+        if self.format == "raw" and raw is not None:
+            # Protobuf with encrypted payloads hardly compresses.
+            return "raw", bytes(raw)
+        data = text.encode("utf-8")
+        if self.compression == "zlib":
+            return "zlib", zlib.compress(data, self.level)
+        if self.compression == "zstd":
+            return "zstd", zstandard.ZstdCompressor(
+                level=self.level
+            ).compress(data)
+        return "none", data
+
+
+def unpack(encoding, payload):
+    """Packet dict of a row written by MeshlogCodec.pack()."""
+    if encoding == "raw":
+        from process_payload import get_data, get_packet
+        # No key for the channel (any more) leaves the packet undecoded.
+        packet = get_packet(payload) if payload else None
+        data = get_data(packet) if packet is not None else None
+        return data if data is not None else {"raw": (payload or b"").hex()}
+    if encoding == "zlib":
+        payload = zlib.decompress(payload)
+    elif encoding == "zstd":
+        if zstandard is None:
+            return {"error": "zstandard is not installed"}
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    return json.loads(payload)
+
+
+_codec = None
+_codec_lock = threading.Lock()
+
+
+def get_codec():
+    global _codec
+    if _codec is None:
+        with _codec_lock:
+            if _codec is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _codec = MeshlogCodec.from_config(config)
+    return _codec
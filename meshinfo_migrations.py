@@ -0,0 +1,200 @@
+import argparse
+import logging
+import meshinfo_rollup
+
+logger = logging.getLogger(__name__)
+
+
+def add_column(table, column, definition):
+    def step(cur):
+        cur.execute(
+            """SELECT 1 FROM information_schema.columns
+WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s""",
+            (table, column)
+        )
+        if cur.fetchone():
+            return False
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    step.description = f"column {table}.{column}"
+    return step
+
+
+def add_index(table, name, columns):
+    def step(cur):
+        cur.execute(
+            """SELECT 1 FROM information_schema.statistics
+WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1""",
+            (table, name)
+        )
+        if cur.fetchone():
+            return False
+        cur.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+        return True
+    step.description = f"index {name} on {table} ({columns})"
+    return step
+
+
+def create_table(name, ddl):
+    def step(cur):
+        cur.execute(
+            """SELECT 1 FROM information_schema.tables
+WHERE table_schema = DATABASE() AND table_name = %s""",
+            (name, )
+        )
+        if cur.fetchone():
+            return False
+        cur.execute(ddl)
+        return True
+    step.description = f"table {name}"
+    return step
+
+
+# Append only. Every step checks the live schema first, so a migration
+# that was interrupted half way can simply be run again. Steps look at
+# DATABASE(), the schema the connection actually uses.
+MIGRATIONS = [
+    (1, "Node columns missing from the original schema", [
+        add_column("nodeinfo", "macaddr", "VARCHAR(64)"),
+        add_column("nodeinfo", "public_key", "VARCHAR(64)"),
+        add_column("nodeinfo", "hop_start", "INT UNSIGNED"),
+    ]),
+    (2, "Indexes for time ordered reads", [
+        add_index("meshlog", "idx_meshlog_ts_created", "ts_created"),
+        add_index("text", "idx_text_to_id_ts_created", "to_id, ts_created"),
+        add_index("traceroute", "idx_traceroute_ts_created", "ts_created"),
+        add_index("telemetry", "idx_telemetry_id_ts_created", "id, ts_created"),
+        add_index("telemetry", "idx_telemetry_ts_created", "ts_created"),
+        add_index(
+            "telemetry", "idx_telemetry_id_telemetry_time",
+            "id, telemetry_time"
+        ),
+    ]),
+    (3, "Telemetry rollups for long range history", [
+        create_table("telemetry_rollup", meshinfo_rollup.CREATE_TABLE),
+        meshinfo_rollup.backfill,
+    ]),
+    (4, "Compact meshlog rows with extracted columns", [
+        add_column("meshlog", "encoding", "VARCHAR(8)"),
+        add_column("meshlog", "payload", "BLOB"),
+        add_column("meshlog", "from_id", "INT UNSIGNED"),
+        add_column("meshlog", "to_id", "INT UNSIGNED"),
+        add_column("meshlog", "portnum", "INT UNSIGNED"),
+        add_column("meshlog", "gateway", "INT UNSIGNED"),
+        add_index("meshlog", "idx_meshlog_from_id_ts_created", "from_id, ts_created"),
+    ]),
+]
+
+# Queries used by the EXPLAIN report, with the index each one relies on.
+# {hint} is replaced with an IGNORE INDEX clause for the "before" plan.
+DIAGNOSTICS = [
+    ("idx_meshlog_ts_created", "get_logs", """SELECT * FROM meshlog {hint}
+ORDER BY ts_created DESC LIMIT 100"""),
+    ("idx_meshlog_from_id_ts_created", "get_logs node", """SELECT topic
+FROM meshlog {hint} WHERE from_id = 1 ORDER BY ts_created DESC LIMIT 100"""),
+    ("idx_text_to_id_ts_created", "get_chat", """SELECT from_id, to_id,
+channel, text, MIN(ts_created) AS ts_created FROM text {hint}
+WHERE to_id = 4294967295 GROUP BY from_id, to_id, channel, text
+ORDER BY ts_created DESC LIMIT 100"""),
+    ("idx_traceroute_ts_created", "retention", """SELECT ts_created FROM
+traceroute {hint} ORDER BY ts_created DESC LIMIT 1 OFFSET 1000"""),
+    ("idx_telemetry_id_ts_created", "get_node_telemetry", """SELECT * FROM
+telemetry {hint} WHERE ts_created >= NOW() - INTERVAL 1 DAY AND id = 1
+AND battery_level IS NOT NULL ORDER BY ts_created"""),
+    ("idx_telemetry_ts_created", "get_telemetry_all", """SELECT * FROM
+telemetry {hint} WHERE battery_level IS NOT NULL OR temperature IS NOT NULL
+ORDER BY ts_created DESC LIMIT 500"""),
+    ("idx_telemetry_id_telemetry_time", "get_nodes telemetry", """SELECT id,
+MAX(telemetry_time) FROM telemetry {hint} WHERE battery_level IS NOT NULL
+GROUP BY id"""),
+]
+
+
+def current_version(md):
+    cur = md.db.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+    version INT UNSIGNED PRIMARY KEY,
+    description VARCHAR(255),
+    ts_applied TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)""")
+    cur.execute("SELECT MAX(version) FROM schema_version")
+    row = cur.fetchone()
+    cur.close()
+    return row[0] or 0
+
+
+def migrate(md):
+    """Apply all pending migrations; returns the resulting version."""
+    version = current_version(md)
+    for number, description, steps in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info(f"Applying migration {number}: {description}")
+        cur = md.db.cursor()
+        for step in steps:
+            if step(cur):
+                logger.info(f"  added {step.description}")
+            else:
+                logger.info(f"  {step.description} already present")
+        cur.execute(
+            "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+            (number, description)
+        )
+        cur.close()
+        md.commit()
+        version = number
+    return version
+
+
+def explain(md, sql):
+    cur = md.db.cursor()
+    cur.execute("EXPLAIN " + sql)
+    column_names = [desc[0] for desc in cur.description]
+    rows = [dict(zip(column_names, row)) for row in cur.fetchall()]
+    cur.close()
+    return rows
+
+
+def print_plan(label, rows):
+    for row in rows:
+        print(
+            f"  {label:<7} table={row.get('table')} type={row.get('type')} "
+            f"key={row.get('key')} rows={row.get('rows')} "
+            f"extra={row.get('Extra')}"
+        )
+
+
+def report(md):
+    print(f"Schema version: {current_version(md)}")
+    for index, name, sql in DIAGNOSTICS:
+        print(f"{name} ({index})")
+        try:
+            print_plan("before", explain(
+                md, sql.format(hint=f"IGNORE INDEX ({index})")
+            ))
+            print_plan("after", explain(md, sql.format(hint="")))
+        except Exception as e:
+            print(f"  unavailable: {e}")
+
+
+if __name__ == "__main__":
+    from meshdata import MeshData
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument(
+        "command",
+        choices=["migrate", "status", "explain"],
+        help="apply pending migrations, show the version or EXPLAIN report"
+    )
+    args = parser.parse_args()
+    md = MeshData()
+    if args.command == "migrate":
+        md.setup_database()
+        print(f"Schema version: {current_version(md)}")
+    elif args.command == "status":
+        version = current_version(md)
+        for number, description, _ in MIGRATIONS:
+            state = "applied" if number <= version else "pending"
+            print(f"{number:>4} {state:<8} {description}")
+    else:
+        report(md)
@@ -1,6 +1,8 @@
 import logging
 from paho.mqtt import client as mqtt_client
 from process_payload import process_payload
+import meshinfo_capture
+import meshinfo_ingest
 import configparser
 import time
 
@@ -52,9 +54,19 @@ def connect_mqtt() -> mqtt_client:
 
 
 def subscribe(client: mqtt_client):
+    pipeline = None
+    if config.getboolean("ingest", "enabled", fallback=True):
+        pipeline = meshinfo_ingest.get_pipeline()
+    capture = meshinfo_capture.get_writer()
+
     def on_message(client, userdata, msg):
         if "/2/e/" in msg.topic or "/2/map/" in msg.topic:
-            process_payload(msg.payload, msg.topic)
+            if capture:
+                capture.write(time.time(), msg.topic, msg.payload)
+            if pipeline:
+                pipeline.submit(msg.payload, msg.topic)
+            else:
+                process_payload(msg.payload, msg.topic)
 
     client.subscribe(config["mqtt"]["topic"])
     client.on_message = on_message
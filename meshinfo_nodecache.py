@@ -0,0 +1,151 @@
+import configparser
+import logging
+import threading
+import time
+import utils
+import meshinfo_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class NodeSnapshot:
+    """Shared in-memory copy of get_nodes() kept current by the ingest path.
+
+    The snapshot always holds every node with neighbors, position and
+    latest telemetry. Store methods mark the nodes they touched as dirty
+    once their transaction is committed and only those nodes are reloaded
+    on the next read. After ttl seconds the whole snapshot is rebuilt.
+    """
+
+    def __init__(self, enabled=True, ttl=300, active_threshold=7200):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.active_threshold = active_threshold
+        self.nodes = None
+        self.version = 0
+        self.loaded = None
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.dirty_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            enabled=config.getboolean("cache", "nodes", fallback=True),
+            ttl=config.getfloat("cache", "nodes_ttl", fallback=300),
+            active_threshold=int(
+                config["server"]["node_activity_prune_threshold"]
+            )
+        )
+
+    def invalidate(self, node_ids=None):
+        """Mark nodes for reload, or the whole snapshot if no ids given."""
+        if not self.enabled:
+            return
+        if node_ids is None:
+            self.loaded = None
+            return
+        with self.dirty_lock:
+            self.dirty.update(node_ids)
+
+    def invalidate_position(self, node_id):
+        """A moved node also changes neighbor distances of other nodes."""
+        ids = {node_id}
+        nodes = self.nodes
+        if nodes:
+            for record in list(nodes.values()):
+                for neighbor in record.get("neighbors", []):
+                    if neighbor["neighbor_id"] == node_id:
+                        ids.add(record["id"])
+                        break
+        self.invalidate(ids)
+
+    def touch(self, node_id, via=None):
+        """Record a ts_seen update without going back to the database."""
+        nodes = self.nodes
+        if not self.enabled or nodes is None:
+            return
+        hexid = utils.convert_node_id_from_int_to_hex(node_id)
+        record = nodes.get(hexid)
+        if record is None:
+            self.invalidate([node_id])
+            return
+        updated = dict(record)
+        updated["ts_seen"] = time.time()
+        if via:
+            updated["updated_via"] = via
+        nodes[hexid] = updated
+
+    def node(self, node_id):
+        """Cached record of one node, None if not cached; never loads."""
+        nodes = self.nodes
+        if not self.enabled or nodes is None:
+            return None
+        return nodes.get(utils.convert_node_id_from_int_to_hex(node_id))
+
+    def _load(self, md):
+        with self.dirty_lock:
+            dirty = self.dirty
+            self.dirty = set()
+        if self.nodes is None or self.loaded is None or \
+                time.monotonic() - self.loaded > self.ttl:
+            metrics.inc("node_cache_misses")
+            self.nodes = md.query_nodes()
+            self.loaded = time.monotonic()
+            self.version += 1
+        elif dirty:
+            metrics.inc("node_cache_refreshes")
+            fresh = md.query_nodes(ids=sorted(dirty))
+            nodes = dict(self.nodes)
+            for node_id in dirty:
+                hexid = utils.convert_node_id_from_int_to_hex(node_id)
+                if hexid in fresh:
+                    nodes[hexid] = fresh[hexid]
+                else:
+                    nodes.pop(hexid, None)
+            self.nodes = nodes
+            self.version += 1
+        else:
+            metrics.inc("node_cache_hits")
+        metrics.set_gauge("node_cache_version", self.version)
+        return self.nodes
+
+    def get_nodes(self, md, active=False, with_neighbors=True,
+                  with_position=True):
+        with self.lock:
+            try:
+                snapshot = self._load(md)
+            except Exception:
+                self.nodes = None
+                raise
+        now = time.time()
+        threshold = now - self.active_threshold
+        nodes = {}
+        for hexid, record in snapshot.items():
+            is_active = record["ts_seen"] > threshold
+            if active and not is_active:
+                continue
+            node = dict(record)
+            node["active"] = is_active
+            node["last_seen"] = utils.time_since(node["ts_seen"])
+            if not with_neighbors:
+                node.pop("neighbors", None)
+            if not with_position:
+                node.pop("position", None)
+            nodes[hexid] = node
+        return nodes
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _snapshot = NodeSnapshot.from_config(config)
+    return _snapshot
@@ -0,0 +1,147 @@
+import configparser
+import logging
+import threading
+import time
+import utils
+import meshinfo_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SeenTracker:
+    """Known node ids plus coalesced ts_seen/updated_via updates.
+
+    verify_node() only touches the database for ids it has not seen
+    before. Everything else is kept in memory and written periodically
+    as one multi-row INSERT ... ON DUPLICATE KEY UPDATE.
+    """
+
+    def __init__(self, flush_interval=5, chunk_size=500):
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self.known = None
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            flush_interval=config.getfloat(
+                "ingest", "seen_flush_interval", fallback=5
+            )
+        )
+
+    def is_known(self, md, node_id):
+        if self.known is None:
+            cur = md.db.cursor()
+            cur.execute("SELECT id FROM nodeinfo")
+            known = {row[0] for row in cur.fetchall()}
+            cur.close()
+            with self.lock:
+                if self.known is None:
+                    self.known = known
+        return node_id in self.known
+
+    def add(self, node_id):
+        with self.lock:
+            if self.known is not None:
+                self.known.add(node_id)
+
+    def reset(self):
+        """Forget known ids, e.g. after nodes were deleted."""
+        with self.lock:
+            self.known = None
+
+    def seen(self, node_id, via=None):
+        with self.lock:
+            previous = self.pending.get(node_id)
+            if not via and previous:
+                via = previous[1]
+            self.pending[node_id] = (time.time(), via)
+        self.start()
+
+    def flush(self, md):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        if not pending:
+            return 0
+        items = list(pending.items())
+        try:
+            self._write(md, items)
+        except Exception:
+            # Put the updates back unless a newer one arrived meanwhile.
+            with self.lock:
+                for node_id, update in pending.items():
+                    self.pending.setdefault(node_id, update)
+            raise
+        metrics.inc("seen_flushed", len(items))
+        return len(items)
+
+    def _write(self, md, items):
+        for start in range(0, len(items), self.chunk_size):
+            chunk = items[start:start + self.chunk_size]
+            values = []
+            params = []
+            for node_id, (ts_seen, via) in chunk:
+                short_name = utils.convert_node_id_from_int_to_hex(node_id)[-4:]
+                values.append("(%s, %s, %s, FROM_UNIXTIME(%s), %s)")
+                params.extend([
+                    node_id,
+                    f"Meshtastic {short_name}",
+                    short_name,
+                    ts_seen,
+                    via
+                ])
+            # New rows only happen when a node was deleted meanwhile.
+            sql = """INSERT INTO nodeinfo
+(id, long_name, short_name, ts_seen, updated_via)
+VALUES """ + ", ".join(values) + """
+ON DUPLICATE KEY UPDATE
+ts_seen = GREATEST(ts_seen, VALUES(ts_seen)),
+updated_via = COALESCE(VALUES(updated_via), updated_via)"""
+            cur = md.db.cursor()
+            cur.execute(sql, params)
+            cur.close()
+            md.commit()
+
+    def _flush_loop(self):
+        from meshdata import MeshData
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                md = MeshData()
+                try:
+                    self.flush(md)
+                finally:
+                    md.close()
+            except Exception as e:
+                logger.error(f"Failed to flush ts_seen updates: {e}")
+
+    def start(self):
+        if self.flusher is not None:
+            return
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self._flush_loop,
+                    name="seen-flush",
+                    daemon=True
+                )
+                self.flusher.start()
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _tracker = SeenTracker.from_config(config)
+    return _tracker
@@ -1,5 +1,5 @@
 import configparser
-import mysql.connector
+import meshinfo_dbpool
 import bcrypt
 import utils
 import re
@@ -15,15 +15,7 @@ class Register:
         config = configparser.ConfigParser()
         config.read('config.ini')
         self.config = config
-        self.db = mysql.connector.connect(
-            host=self.config["database"]["host"],
-            user=self.config["database"]["username"],
-            password=self.config["database"]["password"],
-            database=self.config["database"]["database"],
-            charset="utf8mb4"
-        )
-        cur = self.db.cursor()
-        cur.execute("SET NAMES utf8mb4;")
+        self.db = meshinfo_dbpool.get_connection()
 
     def verify(self, username, email):
         sql = "SELECT 1 FROM meshuser WHERE username=%s OR email=%s"
@@ -155,3 +147,4 @@ WHERE email = %s"""
     def __del__(self):
         if self.db:
             self.db.close()
+            self.db = None
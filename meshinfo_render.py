@@ -0,0 +1,160 @@
+import configparser
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import meshinfo_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RenderBusy(Exception):
+    pass
+
+
+def warm_up():
+    """Import the plotting stack once in every worker."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    import meshinfo_telemetry_graph  # noqa: F401
+    import meshinfo_env_graph  # noqa: F401
+    import meshinfo_los_profile  # noqa: F401
+    return True
+
+
+class RenderPool:
+    """Long-lived worker processes for matplotlib charts.
+
+    Shared by all web threads. At most max_pending tasks may be queued or
+    running; further callers wait up to timeout seconds for a slot and
+    then get RenderBusy. Waiting for a result raises TimeoutError after
+    timeout seconds. Latencies (queue + render) are recorded per function
+    as render_<name>_seconds histograms.
+
+    Workers are forked once at startup. If the pool breaks, it is not
+    forked again from the running, threaded server; charts are rendered
+    in the calling thread, one at a time, until restart.
+    """
+
+    def __init__(self, workers=2, max_pending=16, timeout=30):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.inline_lock = threading.Lock()
+        self.executor = None
+        self.broken = False
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            workers=config.getint("render", "workers", fallback=2),
+            max_pending=config.getint("render", "max_pending", fallback=16),
+            timeout=config.getfloat("render", "timeout", fallback=30)
+        )
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None and not self.broken:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("fork")
+                )
+            return self.executor
+
+    def _reset(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+                self.broken = True
+                logger.error(
+                    "Render pool broken, rendering charts in the web "
+                    "threads until restart"
+                )
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _inline(self, func, args):
+        with self.inline_lock:
+            return func(*args)
+
+    def start(self):
+        """Fork the workers; call before other threads are started."""
+        started = time.monotonic()
+        executor = self._get_executor()
+        for future in [
+            executor.submit(warm_up) for _ in range(self.workers)
+        ]:
+            future.result()
+        logger.info(
+            f"Render pool with {self.workers} workers ready in "
+            f"{time.monotonic() - started:.1f}s"
+        )
+
+    def submit(self, func, *args):
+        """Queue func(*args) in a worker; returns a Future."""
+        queued = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            metrics.inc("render_busy")
+            raise RenderBusy(f"Render queue full, {func.__name__} rejected")
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                future = Future()
+                try:
+                    future.set_result(self._inline(func, args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = executor.submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        # The slot is held until the worker is really done, even when the
+        # caller has given up waiting.
+        future.add_done_callback(lambda f: self.slots.release())
+        future.render_name = func.__name__
+        future.render_queued = queued
+        future.render_executor = executor
+        return future
+
+    def wait(self, future):
+        """Result of a submitted task, at most timeout seconds from now."""
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            metrics.inc("render_timeouts")
+            raise
+        except BrokenProcessPool:
+            metrics.inc("render_pool_broken")
+            self._reset(future.render_executor)
+            raise
+        metrics.observe(
+            f"render_{future.render_name}_seconds",
+            time.monotonic() - future.render_queued
+        )
+        return result
+
+    def run(self, func, *args):
+        """Run func(*args) in a worker and return its result."""
+        return self.wait(self.submit(func, *args))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _pool = RenderPool.from_config(config)
+    return _pool
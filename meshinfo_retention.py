@@ -0,0 +1,133 @@
+import configparser
+import logging
+import time
+import meshinfo_metrics as metrics
+import meshinfo_rollup
+from meshdata import MeshData
+
+logger = logging.getLogger(__name__)
+
+# Default limits per table: (max rows, max age in days). None = unlimited.
+# Override in config.ini, e.g.:
+#
+#   [retention]
+#   interval = 60
+#   chunk_size = 1000
+#   telemetry_max_rows = 20000
+#   telemetry_max_age_days = 30
+#   meshlog_max_rows = 2000
+#
+# telemetry_rollup is trimmed per resolution, see meshinfo_rollup.
+DEFAULT_POLICIES = {
+    "telemetry": (20000, None),
+    "meshlog": (2000, None),
+    "traceroute": (None, None),
+    "text": (None, None),
+}
+
+
+class RetentionEngine:
+    """Trims tables to their row-count and age limits in bounded chunks."""
+
+    def __init__(self, policies, interval=60, chunk_size=1000):
+        self.policies = policies
+        self.interval = interval
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_config(cls, config):
+        policies = {}
+        for table, (max_rows, max_age) in DEFAULT_POLICIES.items():
+            max_rows = config.getint(
+                "retention", f"{table}_max_rows", fallback=max_rows
+            )
+            max_age = config.getfloat(
+                "retention", f"{table}_max_age_days", fallback=max_age
+            )
+            if max_rows or max_age:
+                policies[table] = (max_rows, max_age)
+        return cls(
+            policies,
+            interval=config.getfloat("retention", "interval", fallback=60),
+            chunk_size=config.getint("retention", "chunk_size", fallback=1000)
+        )
+
+    def _delete_chunks(self, md, table, where, params):
+        sql = f"DELETE FROM {table} WHERE {where} LIMIT {self.chunk_size}"
+        deleted = 0
+        while True:
+            cur = md.db.cursor()
+            cur.execute(sql, params)
+            count = cur.rowcount
+            cur.close()
+            md.commit()
+            deleted += count
+            if count < self.chunk_size:
+                return deleted
+
+    def enforce_age(self, md, table, max_age_days):
+        return self._delete_chunks(
+            md,
+            table,
+            "ts_created < NOW() - INTERVAL %s SECOND",
+            (int(max_age_days * 86400), )
+        )
+
+    def enforce_rows(self, md, table, max_rows):
+        # Timestamp of the newest row that is over the limit.
+        sql = f"""SELECT ts_created FROM {table}
+ORDER BY ts_created DESC LIMIT 1 OFFSET %s"""
+        cur = md.db.cursor()
+        cur.execute(sql, (max_rows, ))
+        row = cur.fetchone()
+        cur.close()
+        if not row:
+            return 0
+        return self._delete_chunks(md, table, "ts_created <= %s", (row[0], ))
+
+    def run_once(self):
+        md = MeshData()
+        try:
+            for table, (max_rows, max_age) in self.policies.items():
+                deleted = 0
+                if max_age:
+                    deleted += self.enforce_age(md, table, max_age)
+                if max_rows:
+                    deleted += self.enforce_rows(md, table, max_rows)
+                if deleted:
+                    metrics.inc(f"retention_deleted_{table}", deleted)
+                    logger.debug(f"Retention removed {deleted} rows from {table}")
+            rollup = meshinfo_rollup.get_rollup()
+            if rollup.enabled:
+                deleted = rollup.prune(
+                    lambda table, where, params:
+                        self._delete_chunks(md, table, where, params)
+                )
+                if deleted:
+                    metrics.inc("retention_deleted_telemetry_rollup", deleted)
+        finally:
+            md.close()
+
+    def run_forever(self):
+        logger.info(f"Retention policies: {self.policies}")
+        while True:
+            start = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
+            metrics.observe("retention_run_seconds", time.monotonic() - start)
+            time.sleep(self.interval)
+
+
+def run():
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    RetentionEngine.from_config(config).run_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    RetentionEngine.from_config(config).run_once()
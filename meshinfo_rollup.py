@@ -0,0 +1,220 @@
+import configparser
+import math
+import threading
+import meshinfo_metrics as metrics
+
+# Numeric telemetry columns, each rolled up as its own metric
+METRICS = (
+    "air_util_tx",
+    "battery_level",
+    "channel_utilization",
+    "uptime_seconds",
+    "voltage",
+    "temperature",
+    "relative_humidity",
+    "barometric_pressure",
+    "gas_resistance",
+    "current"
+)
+
+# Bucket width in seconds -> days the buckets are kept. Override with
+#
+#   [rollup]
+#   enabled = true
+#   resolutions = 300:2, 3600:90, 86400:730
+#   max_points = 500
+DEFAULT_RESOLUTIONS = {
+    300: 2,
+    3600: 90,
+    86400: 730,
+}
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS telemetry_rollup (
+    resolution INT UNSIGNED NOT NULL,
+    id INT UNSIGNED NOT NULL,
+    metric VARCHAR(32) NOT NULL,
+    bucket INT UNSIGNED NOT NULL,
+    min_value DOUBLE,
+    max_value DOUBLE,
+    sum_value DOUBLE,
+    cnt INT UNSIGNED NOT NULL,
+    PRIMARY KEY (resolution, id, metric, bucket),
+    INDEX idx_telemetry_rollup_bucket (resolution, bucket)
+)"""
+
+UPSERT = """INSERT INTO telemetry_rollup
+(resolution, id, metric, bucket, min_value, max_value, sum_value, cnt)
+VALUES {values}
+ON DUPLICATE KEY UPDATE
+min_value = LEAST(min_value, VALUES(min_value)),
+max_value = GREATEST(max_value, VALUES(max_value)),
+sum_value = sum_value + VALUES(sum_value),
+cnt = cnt + VALUES(cnt)"""
+
+
+def parse_resolutions(text):
+    """"300:2, 3600:90" -> {300: 2.0, 3600: 90.0}"""
+    resolutions = {}
+    for item in text.split(","):
+        if item.strip():
+            width, days = item.split(":")
+            resolutions[int(width)] = float(days)
+    return resolutions
+
+
+class Rollup:
+    """Per node and metric min/max/sum/count in fixed time buckets.
+
+    Every stored telemetry packet is added to one bucket per resolution
+    with a single upsert, so the rollups are always current. Readers
+    get the coarsest resolution that still has enough points for the
+    requested range.
+    """
+
+    def __init__(self, enabled=True, resolutions=None, max_points=500):
+        self.enabled = enabled
+        self.resolutions = dict(sorted(
+            (resolutions or DEFAULT_RESOLUTIONS).items()
+        ))
+        self.max_points = max_points
+
+    @classmethod
+    def from_config(cls, config):
+        resolutions = config.get("rollup", "resolutions", fallback=None)
+        return cls(
+            enabled=config.getboolean("rollup", "enabled", fallback=True),
+            resolutions=parse_resolutions(resolutions) if resolutions else None,
+            max_points=config.getint("rollup", "max_points", fallback=500)
+        )
+
+    def store(self, cur, node_id, ts, values):
+        """Add one telemetry sample taken at unix time ts."""
+        if not self.enabled:
+            return
+        rows = []
+        params = []
+        for metric in METRICS:
+            value = values.get(metric)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            for width in self.resolutions:
+                rows.append("(%s, %s, %s, %s, %s, %s, %s, 1)")
+                params.extend([
+                    width, node_id, metric, int(ts // width) * width,
+                    value, value, value
+                ])
+        if rows:
+            cur.execute(UPSERT.format(values=", ".join(rows)), params)
+            metrics.inc("rollup_updates")
+
+    def resolution_for(self, since, now, buckets=None):
+        """Bucket width to read for the range since..now, or None.
+
+        The coarsest resolution that still gives the requested number of
+        buckets (at most max_points), among those whose retention reaches
+        back to since; the finest of those if all are too coarse.
+        """
+        points = min(buckets or self.max_points, self.max_points)
+        target = (now - since) / points
+        best = None
+        for width, days in self.resolutions.items():
+            if since < now - days * 86400:
+                continue
+            if best is None or width <= target:
+                best = width
+        return best
+
+    def query(self, cur, node_id, fields, since, now, buckets=None):
+        """Columnar min/avg/max series in the shape of get_telemetry_series.
+
+        Returns None if no resolution covers the range.
+        """
+        resolution = self.resolution_for(since, now, buckets)
+        if resolution is None:
+            return None
+        width = resolution
+        if buckets:
+            # Merge rollup buckets when the caller asked for fewer points.
+            width *= max(1, math.ceil((now - since) / buckets / resolution))
+        placeholders = ", ".join(["%s"] * len(fields))
+        sql = f"""SELECT metric, FLOOR(bucket / %s) AS b,
+MIN(min_value), SUM(sum_value) / SUM(cnt), MAX(max_value)
+FROM telemetry_rollup
+WHERE resolution = %s AND id = %s AND metric IN ({placeholders})
+AND bucket >= %s
+GROUP BY metric, b"""
+        cur.execute(
+            sql,
+            [width, resolution, node_id] + list(fields)
+            + [int(since // resolution) * resolution]
+        )
+        values = {}
+        for metric, b, low, avg, high in cur.fetchall():
+            values[(int(b), metric)] = (low, avg, high)
+        series = {"ts": [], "bucket": width, "resolution": resolution}
+        for field in fields:
+            series[field] = {"min": [], "avg": [], "max": []}
+        for b in sorted({b for b, _ in values}):
+            series["ts"].append(b * width)
+            for field in fields:
+                low, avg, high = values.get((b, field), (None, None, None))
+                series[field]["min"].append(round_value(low))
+                series[field]["avg"].append(round_value(avg))
+                series[field]["max"].append(round_value(high))
+        metrics.inc("rollup_queries")
+        return series
+
+    def prune(self, delete_chunks):
+        """Drop buckets past their retention; returns rows deleted.
+
+        delete_chunks(table, where, params) is RetentionEngine's chunked
+        DELETE.
+        """
+        deleted = 0
+        for width, days in self.resolutions.items():
+            deleted += delete_chunks(
+                "telemetry_rollup",
+                "resolution = %s AND bucket < UNIX_TIMESTAMP() - %s",
+                (width, int(days * 86400))
+            )
+        return deleted
+
+
+def round_value(value):
+    if value is None:
+        return None
+    return round(float(value), 3)
+
+
+def backfill(cur):
+    """Migration step: build the rollups from the raw telemetry rows."""
+    # Runs before ingest starts, so a rerun may simply start over.
+    cur.execute("DELETE FROM telemetry_rollup")
+    # The resolutions store() and prune() use, not the defaults.
+    for width in get_rollup().resolutions:
+        for metric in METRICS:
+            cur.execute(f"""INSERT INTO telemetry_rollup
+(resolution, id, metric, bucket, min_value, max_value, sum_value, cnt)
+SELECT %s, id, %s, FLOOR(UNIX_TIMESTAMP(ts_created) / %s) * %s AS b,
+MIN({metric}), MAX({metric}), SUM({metric}), COUNT({metric})
+FROM telemetry WHERE {metric} IS NOT NULL
+GROUP BY id, b""", (width, metric, width, width))
+    return True
+
+
+backfill.description = "telemetry_rollup rows from telemetry"
+
+
+_rollup = None
+_rollup_lock = threading.Lock()
+
+
+def get_rollup():
+    global _rollup
+    if _rollup is None:
+        with _rollup_lock:
+            if _rollup is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _rollup = Rollup.from_config(config)
+    return _rollup
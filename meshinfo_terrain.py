@@ -0,0 +1,241 @@
+import configparser
+import logging
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from rasterio.transform import rowcol
+from rasterio.windows import Window
+import meshinfo_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RasterLayer:
+    """Band 1 of a GeoTIFF, sampled at latitude/longitude points.
+
+    Subclasses decide where the pixels come from; see MappedRasterLayer
+    and TiledRasterLayer.
+    """
+
+    def __init__(self, path, interpolation="nearest"):
+        self.path = path
+        self.interpolation = interpolation
+        self.transform = None
+        self.bounds = None
+        self.height = 0
+        self.width = 0
+
+    def _describe(self, dataset):
+        self.transform = dataset.transform
+        self.bounds = dataset.bounds
+        self.height = dataset.height
+        self.width = dataset.width
+
+    def _read(self, rows, cols):
+        raise NotImplementedError
+
+    def contains(self, lat, lon):
+        return self.bounds.left <= lon <= self.bounds.right and \
+            self.bounds.bottom <= lat <= self.bounds.top
+
+    def index(self, lats, lons):
+        rows, cols = rowcol(self.transform, lons, lats)
+        rows = np.clip(np.asarray(rows), 0, self.height - 1)
+        cols = np.clip(np.asarray(cols), 0, self.width - 1)
+        return rows, cols
+
+    def _bilinear(self, lats, lons):
+        cols, rows = ~self.transform * (
+            np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+        )
+        # Pixel values belong to pixel centers.
+        rows = rows - 0.5
+        cols = cols - 0.5
+        row0 = np.floor(rows)
+        col0 = np.floor(cols)
+        drow = np.clip(rows - row0, 0, 1)
+        dcol = np.clip(cols - col0, 0, 1)
+        r0 = np.clip(row0.astype(int), 0, self.height - 1)
+        c0 = np.clip(col0.astype(int), 0, self.width - 1)
+        r1 = np.clip(r0 + 1, 0, self.height - 1)
+        c1 = np.clip(c0 + 1, 0, self.width - 1)
+        values = self._read(
+            np.concatenate([r0, r0, r1, r1]),
+            np.concatenate([c0, c1, c0, c1])
+        ).astype(float).reshape(4, -1)
+        top = values[0] * (1 - dcol) + values[1] * dcol
+        bottom = values[2] * (1 - dcol) + values[3] * dcol
+        return top * (1 - drow) + bottom * drow
+
+    def sample(self, lats, lons, interpolation=None):
+        """Values at the given coordinates, clamped to the raster edge."""
+        if (interpolation or self.interpolation) == "bilinear":
+            return self._bilinear(lats, lons)
+        rows, cols = self.index(lats, lons)
+        return self._read(rows, cols)
+
+    def value(self, lat, lon, interpolation=None):
+        if not self.contains(lat, lon):
+            return None
+        return self.sample([lat], [lon], interpolation)[0]
+
+
+class MappedRasterLayer(RasterLayer):
+    """Whole band as a read-only memory-mapped array.
+
+    The band is decoded once into a .npy file next to the raster and
+    mapped from there, so every thread and process shares the same page
+    cache instead of holding its own copy.
+    """
+
+    def __init__(self, path, interpolation="nearest"):
+        super().__init__(path, interpolation)
+        with rasterio.open(path) as dataset:
+            self._describe(dataset)
+            self.data = self._load(dataset)
+
+    def _load(self, dataset):
+        cache_file = os.path.splitext(self.path)[0] + ".npy"
+        try:
+            if not os.path.exists(cache_file) or \
+                    os.path.getmtime(cache_file) < os.path.getmtime(self.path):
+                logger.info(f"Decoding {self.path} into {cache_file}")
+                tmp_file = f"{cache_file}.{os.getpid()}.npy"
+                np.save(tmp_file, dataset.read(1))
+                os.replace(tmp_file, cache_file)
+            return np.load(cache_file, mmap_mode="r")
+        except OSError as e:
+            logger.warning(
+                f"Cannot use {cache_file} ({e}), keeping {self.path} in memory"
+            )
+            return dataset.read(1)
+
+    def _read(self, rows, cols):
+        return self.data[rows, cols]
+
+
+class TiledRasterLayer(RasterLayer):
+    """Reads only the blocks a query touches and keeps the last few.
+
+    Memory stays bounded by tile_cache blocks no matter how large the
+    raster is. Tiles follow the GeoTIFF block layout when the file is
+    tiled, striped files are read in tile_size windows.
+    """
+
+    def __init__(self, path, interpolation="nearest", tile_cache=256,
+                 tile_size=256):
+        super().__init__(path, interpolation)
+        self.dataset = rasterio.open(path)
+        self._describe(self.dataset)
+        self.dtype = np.dtype(self.dataset.dtypes[0])
+        if self.dataset.profile.get("tiled"):
+            self.tile_shape = self.dataset.block_shapes[0]
+        else:
+            self.tile_shape = (tile_size, tile_size)
+        self.tile_cache = tile_cache
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _tile(self, tile_row, tile_col):
+        key = (tile_row, tile_col)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            metrics.inc("terrain_tile_hits")
+            return tile
+        metrics.inc("terrain_tile_misses")
+        height, width = self.tile_shape
+        window = Window(
+            tile_col * width,
+            tile_row * height,
+            min(width, self.width - tile_col * width),
+            min(height, self.height - tile_row * height)
+        )
+        tile = self.dataset.read(1, window=window)
+        self.tiles[key] = tile
+        while len(self.tiles) > self.tile_cache:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def _read(self, rows, cols):
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        height, width = self.tile_shape
+        tile_rows = rows // height
+        tile_cols = cols // width
+        values = np.empty(rows.shape, dtype=self.dtype)
+        keys = np.unique(np.stack([tile_rows, tile_cols]), axis=1)
+        with self.lock:
+            for tile_row, tile_col in keys.T:
+                tile = self._tile(int(tile_row), int(tile_col))
+                mask = (tile_rows == tile_row) & (tile_cols == tile_col)
+                values[mask] = tile[
+                    rows[mask] - tile_row * height,
+                    cols[mask] - tile_col * width
+                ]
+        return values
+
+
+class TerrainStore:
+    """Terrain and forest rasters shared by the whole process.
+
+    [terrain] mode = mmap maps the whole band, mode = tiled reads blocks
+    on demand (for DEMs too large to map). interpolation = bilinear
+    applies to elevations only, the forest mask is always nearest.
+    """
+
+    def __init__(self, terrain_file, forest_file, mode="mmap",
+                 interpolation="nearest", tile_cache=256):
+        self.mode = mode
+        self.tile_cache = tile_cache
+        self.terrain = self._open(terrain_file, "Terrain", interpolation)
+        self.forest = self._open(forest_file, "Forest", "nearest")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.get(
+                "terrain", "terrain_file",
+                fallback="srtm_data/terrain_data.tif"
+            ),
+            config.get(
+                "terrain", "forest_file",
+                fallback="srtm_data/forest_data.tif"
+            ),
+            mode=config.get("terrain", "mode", fallback="mmap"),
+            interpolation=config.get(
+                "terrain", "interpolation", fallback="nearest"
+            ),
+            tile_cache=config.getint("terrain", "tile_cache", fallback=256)
+        )
+
+    def _open(self, path, name, interpolation):
+        try:
+            if not os.path.exists(path):
+                logger.warning(f"{name} file '{path}' not found.")
+            elif self.mode == "tiled":
+                return TiledRasterLayer(
+                    path, interpolation, tile_cache=self.tile_cache
+                )
+            else:
+                return MappedRasterLayer(path, interpolation)
+        except Exception as e:
+            logger.error(f"Error loading {name.lower()} file '{path}': {e}")
+        return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = configparser.ConfigParser()
+                config.read("config.ini")
+                _store = TerrainStore.from_config(config)
+    return _store
@@ -1,6 +1,7 @@
 from flask import (
     Flask,
     send_from_directory,
+    send_file,
     render_template,
     request,
     make_response,
@@ -27,7 +28,9 @@ import json
 import datetime
 import time
 import re
-import concurrent.futures
+import meshinfo_chartcache
+import meshinfo_los_cache
+import meshinfo_render
 
 app = Flask(__name__)
 
@@ -38,6 +41,10 @@ UPLOAD_FOLDER = 'www/nodes'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 3 * 1024 * 1024
+LOS_IMAGE_MAX_AGE = 365 * 24 * 3600
+# Node page charts: "client" draws them in the browser from
+# /api/node/<id>/telemetry, "server" renders PNGs with matplotlib
+NODE_CHARTS = config.get("webserver", "charts", fallback="client")
 app.secret_key = 'g15r65g1rb65rv1g5rfv516ff5fffff555'
 
 
@@ -460,6 +467,60 @@ def debug():
     )
 
 
+# chart -> (telemetry rows, drawing function)
+NODE_GRAPHS = {
+    "telemetry": (MeshData.get_node_telemetry, draw_graph),
+    "env": (MeshData.get_node_env_telemetry, draw_env_graph),
+}
+
+
+def node_graphs(md, node_id):
+    """Telemetry and environment charts, redrawn only after new data."""
+    charts = meshinfo_chartcache.get_cache()
+    watermarks = md.get_telemetry_watermarks(node_id)
+    graphs = {}
+    futures = {}
+    try:
+        pool = meshinfo_render.get_pool()
+        for chart, (fetch, draw) in NODE_GRAPHS.items():
+            graphs[chart] = charts.get(node_id, chart, watermarks[chart])
+            if graphs[chart] is None:
+                futures[chart] = pool.submit(draw, fetch(md, node_id))
+        for chart, future in futures.items():
+            graphs[chart] = pool.wait(future)
+            charts.put(node_id, chart, watermarks[chart], graphs[chart])
+    except Exception as e:
+        app.logger.error(f"Error drawing graphs for {node_id}: {e!r}")
+    return graphs.get("telemetry"), graphs.get("env")
+
+
+@app.route('/los/<key>.png')
+def los_image(key):
+    if not re.fullmatch(r"[0-9a-f]{24}", key):
+        abort(404)
+    cache = meshinfo_los_cache.get_cache()
+    path = cache.find_image(key)
+    if not path:
+        params = cache.image_params(key)
+        if not params:
+            abort(404)
+        coord1, coord2, label = params
+        path = LOSProfile().image_file(
+            coord1, coord2, label, renderer=meshinfo_render.get_pool().run
+        )
+    # The key covers everything the image is drawn from.
+    response = send_file(
+        os.path.abspath(path),
+        mimetype="image/png",
+        conditional=True,
+        etag=True,
+        max_age=LOS_IMAGE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/<path:filename>')
 def serve_static(filename):
     #start_time = time.time()
@@ -485,20 +546,13 @@ def serve_static(filename):
         node_id = utils.convert_node_id_from_hex_to_int(node)
         #app.logger.info(f"converting node ID: {time.time() - start_time:.4f}s")
 
-        node_telemetry = md.get_node_telemetry(node_id)
-        #app.logger.info(f"getting node telemetry: {time.time() - start_time:.4f}s")
-
-        node_env_telemetry = md.get_node_env_telemetry(node_id)
-        #app.logger.info(f"getting node environment telemetry: {time.time() - start_time:.4f}s")
-
         node_route = md.get_route_coordinates(node_id)
         #app.logger.info(f"getting node route: {time.time() - start_time:.4f}s")
 
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            telemetry_future = executor.submit(draw_graph, node_telemetry)
-            env_future = executor.submit(draw_env_graph, node_env_telemetry)
-            telemetry_graph = telemetry_future.result()
-            env_graph = env_future.result()
+        telemetry_graph = None
+        env_graph = None
+        if NODE_CHARTS == "server":
+            telemetry_graph, env_graph = node_graphs(md, node_id)
         #app.logger.info(f"getting graphs: {time.time() - start_time:.4f}s")
 
         lp = LOSProfile(nodes, node_id)
@@ -515,6 +569,7 @@ def serve_static(filename):
                 los_profiles=lp.get_profiles(),
                 telemetry_graph=telemetry_graph,
                 env_graph=env_graph,
+                client_charts=NODE_CHARTS != "server",
                 node_route=node_route,
                 utils=utils,
                 datetime=datetime.datetime,
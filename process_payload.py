@@ -1,120 +1,126 @@
-import base64
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
 from meshtastic import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
-from google.protobuf.json_format import MessageToJson
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import DecodeError
 from meshdata import MeshData
-import configparser
-import json
+import meshinfo_channels
+import meshinfo_dedup
+import meshinfo_metrics as metrics
+import meshinfo_nodeseen
+import utils
 import logging
 
-config = configparser.ConfigParser()
-config.read("config.ini")
+# portnum -> (type, protobuf message of the payload)
+PAYLOAD_TYPES = {
+    portnums_pb2.NODEINFO_APP: ("nodeinfo", mesh_pb2.User),
+    portnums_pb2.MAP_REPORT_APP: ("mapreport", mqtt_pb2.MapReport),
+    portnums_pb2.TEXT_MESSAGE_APP: ("text", None),
+    portnums_pb2.NEIGHBORINFO_APP: ("neighborinfo", mesh_pb2.NeighborInfo),
+    portnums_pb2.ROUTING_APP: ("routing", mesh_pb2.Routing),
+    portnums_pb2.TRACEROUTE_APP: ("traceroute", mesh_pb2.RouteDiscovery),
+    portnums_pb2.POSITION_APP: ("position", mesh_pb2.Position),
+    portnums_pb2.TELEMETRY_APP: ("telemetry", telemetry_pb2.Telemetry),
+}
 
-DEFAULT_KEY = config["mesh"]["channel_key"]
 
+def gateway_id(topic):
+    try:
+        return utils.convert_node_id_from_hex_to_int(topic.split("/")[-1])
+    except ValueError:
+        return None
 
-def decrypt_packet(mp):
-    key_bytes = base64.b64decode(DEFAULT_KEY)
-    nonce_packet_id = getattr(mp, "id").to_bytes(8, "little")
-    nonce_from_node = getattr(mp, "from").to_bytes(8, "little")
-    nonce = nonce_packet_id + nonce_from_node
-    cipher = Cipher(
-        algorithms.AES(key_bytes),
-        modes.CTR(nonce),
-        backend=default_backend()
-    )
-    decryptor = cipher.decryptor()
-    decrypted_bytes = decryptor.update(
+
+def decrypt_packet(mp, channel):
+    decrypted_bytes = channel.decrypt(
+        getattr(mp, "id"),
+        getattr(mp, "from"),
         getattr(mp, "encrypted")
-    ) + decryptor.finalize()
-    data = mesh_pb2.Data()
-    data.ParseFromString(decrypted_bytes)
-    mp.decoded.CopyFrom(data)
+    )
+    # Parse aside: a failed parse would leave an empty decoded behind,
+    # which HasField("decoded") reports as set.
+    decoded = mesh_pb2.Data()
+    try:
+        decoded.ParseFromString(decrypted_bytes)
+    except DecodeError:
+        metrics.inc("channel_decrypt_failed")
+        return None
+    mp.decoded.CopyFrom(decoded)
     return mp
 
 
-def get_packet(payload):
-    mp = None
+def get_packet(payload, topic=None):
+    se = mqtt_pb2.ServiceEnvelope()
     try:
-        se = mqtt_pb2.ServiceEnvelope()
         se.ParseFromString(payload)
-        mp = se.packet
+    except DecodeError as e:
+        metrics.inc("envelope_invalid")
+        logging.error("Failed to parse ServiceEnvelope " + str(e))
+        return None
+    mp = se.packet
+    try:
+        from_id = getattr(mp, "from")
+        if topic and meshinfo_dedup.get_cache().is_duplicate(from_id, mp.id):
+            # Another gateway heard it too, only its ts_seen/via changes.
+            meshinfo_nodeseen.get_tracker().seen(
+                from_id, gateway_id(topic)
+            )
+            return None
         if mp.HasField("encrypted") and not mp.HasField("decoded"):
-            return decrypt_packet(mp)
+            channel = meshinfo_channels.get_registry().lookup(
+                se.channel_id, mp.channel
+            )
+            if channel is None or channel.algorithm is None:
+                return None
+            return decrypt_packet(mp, channel)
     except Exception as e:
+        metrics.inc("channel_decrypt_failed")
         logging.error("Failed to decode payload " + str(e))
     return mp
 
 
 def to_json(msg):
-    return json.loads(
-        MessageToJson(
-            msg,
-            preserving_proto_field_name=True,
-            ensure_ascii=False,
-            indent=2,
-            sort_keys=True,
-            use_integers_for_enums=True
-        )
+    # Same structure as json.loads(MessageToJson(...)), without the
+    # round trip through a JSON string.
+    return MessageToDict(
+        msg,
+        preserving_proto_field_name=True,
+        use_integers_for_enums=True
     )
 
 
 def get_data(msg):
+    if not msg.HasField("decoded"):
+        return None
     j = to_json(msg)
     if "decoded" not in j:
         return None
-    portnum = j["decoded"]["portnum"]
-    if portnum == portnums_pb2.NODEINFO_APP:
-        j["type"] = "nodeinfo"
-        j["decoded"]["json_payload"] = to_json(
-            mesh_pb2.User().FromString(msg.decoded.payload)
-        )
-    elif portnum == portnums_pb2.MAP_REPORT_APP:
-        j["type"] = "mapreport"
-        j["decoded"]["json_payload"] = to_json(
-            mqtt_pb2.MapReport().FromString(msg.decoded.payload)
-        )
-    elif portnum == portnums_pb2.TEXT_MESSAGE_APP:
-        j["type"] = "text"
-        j["decoded"]["json_payload"] = {
-            "text": msg.decoded.payload
-        }
-    elif portnum == portnums_pb2.NEIGHBORINFO_APP:
-        j["type"] = "neighborinfo"
-        j["decoded"]["json_payload"] = to_json(
-            mesh_pb2.NeighborInfo().FromString(msg.decoded.payload)
-        )
-    elif portnum == portnums_pb2.ROUTING_APP:
-        j["type"] = "routing"
-        j["decoded"]["json_payload"] = to_json(
-            mesh_pb2.Routing().FromString(msg.decoded.payload)
-        )
-    elif portnum == portnums_pb2.TRACEROUTE_APP:
-        j["type"] = "traceroute"
-        j["decoded"]["json_payload"] = to_json(
-            mesh_pb2.RouteDiscovery().FromString(msg.decoded.payload)
-        )
-    elif portnum == portnums_pb2.POSITION_APP:
-        j["type"] = "position"
-        j["decoded"]["json_payload"] = to_json(
-            mesh_pb2.Position().FromString(msg.decoded.payload)
-        )
-    elif portnum == portnums_pb2.TELEMETRY_APP:
-        j["type"] = "telemetry"
-        j["decoded"]["json_payload"] = to_json(
-            telemetry_pb2.Telemetry().FromString(msg.decoded.payload)
-        )
-    if "type" in j:
-        msg_type = j["type"]
+    payload_type = PAYLOAD_TYPES.get(msg.decoded.portnum)
+    if payload_type:
+        msg_type, message_class = payload_type
+        j["type"] = msg_type
+        if message_class is None:
+            j["decoded"]["json_payload"] = {
+                "text": msg.decoded.payload
+            }
+        else:
+            j["decoded"]["json_payload"] = to_json(
+                message_class.FromString(msg.decoded.payload)
+            )
         msg_from = j["from"]
         logging.info(f"Received {msg_type} from {msg_from}")
     return j
 
 
-def process_payload(payload, topic):
-    md = MeshData()
-    mp = get_packet(payload)
+def decode_payload(payload, topic):
+    """Packet dict for MeshData.store(), None for packets to skip."""
+    mp = get_packet(payload, topic)
     if mp:
-        data = get_data(mp)
-        md.store(data, topic)
\ No newline at end of file
+        return get_data(mp)
+    return None
+
+
+def process_payload(payload, topic, md=None):
+    data = decode_payload(payload, topic)
+    if data:
+        if md is None:
+            md = MeshData()
+        md.store(data, topic, raw=payload)
\ No newline at end of file
@@ -14,6 +14,8 @@ from email.mime.text import MIMEText
 import configparser
 import logging
 
+EARTH_RADIUS_KM = 6371  # Mean radius of Earth in kilometers
+
 
 def distance_between_two_points(lat1, lon1, lat2, lon2):
     """
@@ -24,8 +26,7 @@ def distance_between_two_points(lat1, lon1, lat2, lon2):
     dlat = lat2 - lat1
     a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
     c = 2 * asin(sqrt(a))
-    radius = 6371  # Radius of Earth in kilometers
-    return radius * c
+    return EARTH_RADIUS_KM * c
 
 
 def calculate_distance_between_nodes(node1, node2):
@@ -69,13 +70,20 @@ def days_since_datetime(dt):
     return (now - dt).days
 
 
+GEOCODE_TIMEOUT = 10
+
+
 def geocode_position(api_key: str, latitude: float, longitude: float):
     """Retrieve geolocation data using an API."""
     if latitude is None or longitude is None:
         return None
     url = f"https://geocode.maps.co/reverse" + \
         f"?lat={latitude}&lon={longitude}&api_key={api_key}"
-    response = requests.get(url)
+    try:
+        response = requests.get(url, timeout=GEOCODE_TIMEOUT)
+    except requests.RequestException as e:
+        logging.warning(f"Geocoding failed: {e}")
+        return None
     return response.json() if response.status_code == 200 else None
 
 
@@ -190,6 +198,21 @@ def get_owner_nodes(nodes, owner):
     }
 
 
+def chat_entry(message, nodes):
+    """A chat message as served by /api/chat and the chat live event."""
+    entry = {
+        "ts_created": message["ts_created"],
+        "from": message["from"],
+        "text": message["text"]
+    }
+    if message["from"] in nodes:
+        node = nodes[message["from"]]
+        entry["short_name"] = node["short_name"]
+        entry["from_name"] = node["long_name"] + " (" + node["short_name"] + ")"
+        entry["from_link"] = f"node_{message['from']}.html"
+    return entry
+
+
 def generate_random_code(length=6):
     characters = string.ascii_letters
     return ''.join(random.choices(characters, k=length))
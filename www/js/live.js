@@ -0,0 +1,30 @@
+// Live updates from /api/events (server-sent events).
+//
+// handlers maps event names to functions taking the parsed event data.
+// reload() fetches the full state; it runs when the server asks for a
+// resync and every interval ms while no event stream is available.
+function liveUpdates(topics, handlers, reload, interval) {
+  if (!window.EventSource) {
+    setInterval(reload, interval);
+    return null;
+  }
+  let pollTimer = null;
+  const startPolling = () => {
+    if (!pollTimer) pollTimer = setInterval(reload, interval);
+  };
+  const source = new EventSource('/api/events?topics=' + topics.join(','));
+  for (const [name, handler] of Object.entries(handlers)) {
+    source.addEventListener(name, event => handler(JSON.parse(event.data)));
+  }
+  source.addEventListener('reset', reload);
+  source.onopen = () => {
+    if (pollTimer) {
+      clearInterval(pollTimer);
+      pollTimer = null;
+    }
+  };
+  // The browser reconnects with Last-Event-ID by itself; poll meanwhile,
+  // and for good if the server refused the stream.
+  source.onerror = startPolling;
+  return source;
+}